@@ -1,26 +1,65 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import os
 from dotenv import load_dotenv
 
-from database import engine, Base
-from routes import users, medications, pharmacies, recipes, orders, auth
+from database import engine, Base, create_missing_indexes, ASYNC_DB, async_engine, async_replica_engines
+from routes import users, medications, pharmacies, recipes, orders, auth, exports, changes
 from models import Usuario, Cliente, Farmacia, Medicamento, StockMedicamento, Receta, Pedido
+from utils.search import setup_search
+from utils.geo import setup_geo
+from utils.inventory import setup_inventory
+from utils.changes import setup_changes, journal_trimmer
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.idempotency import REPLAYED_HEADER
+from utils.events import broker
+from utils.hashing import password_hasher
+from utils.suggest import suggest_index
+from utils.replicas import replica_router, ReadAfterWriteMiddleware
+from utils.pool_stats import pool_snapshot
+from utils.metrics import MetricsMiddleware, install_db_hooks, render_metrics
 
 # Load environment variables
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Latencias por ruta y queries por request en /metrics (ver utils/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+def setup_database():
+    """Create tables, indexes and triggers (idempotent)"""
+    Base.metadata.create_all(bind=engine)
+    setup_search(engine)
+    setup_geo(engine)
+    setup_inventory(engine)
+    setup_changes(engine)
+    create_missing_indexes(engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup. El setup no corre al importar: los procesos del pool de bcrypt
+    # ("spawn") importan este módulo cuando se arranca con `python main.py`.
+    setup_database()
+    await password_hasher.warm_up()
+    broker.start()
+    suggest_index.start()
+    replica_router.start()
+    journal_trimmer.start()
     print("AppFarmaGO Backend iniciado")
     yield
     # Shutdown
+    broker.stop()
+    suggest_index.stop()
+    replica_router.stop()
+    journal_trimmer.stop()
+    password_hasher.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in async_replica_engines:
+        await replica.dispose()
     print("AppFarmaGO Backend cerrado")
 
 app = FastAPI(
@@ -35,6 +74,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permite todos los métodos (POST, GET, etc.)
     allow_headers=["*"],  # Permite todos los headers
+    expose_headers=[NEXT_CURSOR_HEADER, REPLAYED_HEADER],  # Headers propios que el front puede leer
 )
 
 # app.add_middleware(
@@ -50,17 +90,72 @@ app.add_middleware(
     allowed_hosts=os.getenv("ALLOWED_HOSTS", "*").split(",")
 )
 
+if replica_router.enabled:
+    app.add_middleware(ReadAfterWriteMiddleware)
+
+if METRICS_ENABLED:
+    # El último que se agrega queda afuera de todos: mide el request completo
+    install_db_hooks()
+    app.add_middleware(MetricsMiddleware)
+
+def without_routes_of(router: APIRouter, replacement: APIRouter) -> APIRouter:
+    """Copy of `router` without the routes (path and method) that `replacement` also serves"""
+    served = {
+        (route.path_format, method)
+        for route in replacement.routes for method in getattr(route, "methods", None) or ()
+    }
+    remaining = APIRouter()
+    remaining.routes.extend(
+        route for route in router.routes
+        if not any((route.path_format, method) in served for method in getattr(route, "methods", None) or ())
+    )
+    return remaining
+
+medications_router, pharmacies_router, orders_router = medications.router, pharmacies.router, orders.router
+if ASYNC_DB:
+    # Los módulos de rutas exponen `async_router` con las versiones async de
+    # algunas rutas. Una sola implementación por ruta: la async reemplaza a la
+    # sync (without_routes_of quita la sync del router original). Van primero
+    # para que /{id_medicamento:int} se pruebe antes que /suggest.
+    app.include_router(medications.async_router, prefix="/api/medications", tags=["Medications"])
+    app.include_router(pharmacies.async_router, prefix="/api/pharmacies", tags=["Pharmacies"])
+    app.include_router(orders.async_router, prefix="/api/orders", tags=["Orders"])
+    medications_router = without_routes_of(medications.router, medications.async_router)
+    pharmacies_router = without_routes_of(pharmacies.router, pharmacies.async_router)
+    orders_router = without_routes_of(orders.router, orders.async_router)
+
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
-app.include_router(medications.router, prefix="/api/medications", tags=["Medications"])
-app.include_router(pharmacies.router, prefix="/api/pharmacies", tags=["Pharmacies"])
+app.include_router(medications_router, prefix="/api/medications", tags=["Medications"])
+app.include_router(pharmacies_router, prefix="/api/pharmacies", tags=["Pharmacies"])
 app.include_router(recipes.router, prefix="/api/recipes", tags=["Recipes"])
-app.include_router(orders.router, prefix="/api/orders", tags=["Orders"])
+app.include_router(orders_router, prefix="/api/orders", tags=["Orders"])
+app.include_router(exports.router, prefix="/api/exports", tags=["Exports"])
+app.include_router(changes.router, prefix="/api/changes", tags=["Changes"])
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Pool agotado: no hubo conexión libre en DB_POOL_TIMEOUT segundos (queda en /health/pool)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, intentá de nuevo en unos segundos"},
+        headers={"Retry-After": "1"}
+    )
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "service": "AppFarmaGO"}
 
+@app.get("/health/pool")
+def pool_health():
+    """Connection pool gauges (in use, overflow) and checkout wait/timeout counters"""
+    return pool_snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
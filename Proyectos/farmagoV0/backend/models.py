@@ -1,10 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, Enum, ForeignKey, Table, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, Enum, ForeignKey, Table, Date, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from database import Base
 from datetime import datetime
 import enum
 
+# En SQLite, func.now() guarda 'YYYY-MM-DD HH:MM:SS' pero los parámetros datetime
+# se mandan con microsegundos, y como se comparan como texto un cursor
+# (fecha, id) nunca matchea la igualdad. Sin microsegundos ambos coinciden.
+FechaHora = DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
 recipe_medication_association = Table(
     'recipe_medicamentos',
     Base.metadata,
@@ -76,6 +82,8 @@ class Farmacia(Usuario):
     horario_cierre = Column(String(5), nullable=True)    # HH:MM
     latitud = Column(Float, nullable=True)
     longitud = Column(Float, nullable=True)
+    # Celda de la grilla espacial (la calcula utils/geo.py a partir de latitud/longitud)
+    celda_geo = Column(Integer, nullable=True, index=True)
     
     # Relationships
     # Sacamos la 'relationship' a 'Usuario'
@@ -98,6 +106,8 @@ class Medicamento(Base):
     laboratorio = Column(String(100), nullable=False)
     categoria = Column(String(100), nullable=False, index=True)
     fecha_creacion = Column(DateTime, server_default=func.now())
+    # Nombre + principio activo en minúsculas y sin tildes (lo llena utils/search.py)
+    texto_busqueda = Column(Text, nullable=True)
     
     # Relationships
     stocks = relationship("StockMedicamento", back_populates="medicamento", cascade="all, delete-orphan")
@@ -117,6 +127,15 @@ class StockMedicamento(Base):
     # Relationships
     farmacia = relationship("Farmacia", back_populates="stocks")
     medicamento = relationship("Medicamento", back_populates="stocks")
+    
+    __table_args__ = (
+        # "¿Qué farmacias tienen este medicamento?" (id_medicamento = X AND cantidad > 0)
+        Index("ix_stock_medicamento_disponible", "id_medicamento", "cantidad_disponible"),
+        # Una fila por medicamento y farmacia: es el blanco del ON CONFLICT de la carga masiva
+        Index("uq_stock_farmacia_medicamento", "id_farmacia", "id_medicamento", unique=True),
+        # Inventario de una farmacia filtrado por poco stock (low_stock_below)
+        Index("ix_stock_farmacia_cantidad", "id_farmacia", "cantidad_disponible"),
+    )
 
 class Receta(Base):
     __tablename__ = "recetas"
@@ -157,7 +176,7 @@ class Pedido(Base):
     id_pedido = Column(Integer, primary_key=True, index=True)
     id_cliente = Column(Integer, ForeignKey("clientes.id_usuario"), nullable=False, index=True)
     id_farmacia = Column(Integer, ForeignKey("farmacias.id_usuario"), nullable=False, index=True)
-    fecha_pedido = Column(DateTime, server_default=func.now())
+    fecha_pedido = Column(FechaHora, server_default=func.now())
     estado = Column(String(50), default="pendiente", index=True)
     metodo_pago = Column(String(50), nullable=False)
     total = Column(Float, nullable=False)
@@ -168,11 +187,18 @@ class Pedido(Base):
     detalles = relationship("DetallePedido", back_populates="pedido", cascade="all, delete-orphan")
     medicamentos = relationship("Medicamento", secondary=order_medication_association, back_populates="pedidos")
     
+    __table_args__ = (
+        # Historial del cliente, del más nuevo al más viejo (cubre el keyset de GET /api/orders/)
+        Index("ix_pedidos_cliente_fecha", "id_cliente", "fecha_pedido", "id_pedido"),
+        # Cola de la farmacia: pedidos en un estado, del más viejo al más nuevo
+        Index("ix_pedidos_farmacia_estado_fecha", "id_farmacia", "estado", "fecha_pedido", "id_pedido"),
+    )
+    
 class DetallePedido(Base):
     __tablename__ = "detalle_pedidos"
     
     id_detalle = Column(Integer, primary_key=True, index=True)
-    id_pedido = Column(Integer, ForeignKey("pedidos.id_pedido"), nullable=False)
+    id_pedido = Column(Integer, ForeignKey("pedidos.id_pedido"), nullable=False, index=True)
     id_medicamento = Column(Integer, ForeignKey("medicamentos.id_medicamento"), nullable=False)
     cantidad = Column(Integer, nullable=False)
     precio_unitario = Column(Float, nullable=False)
@@ -203,4 +229,30 @@ class MetodoDePago(Base):
     nombre_titular = Column(String(150), nullable=False)
     es_predeterminado = Column(Boolean, default=False)
 
-    cliente = relationship("Cliente", back_populates="metodos_de_pago")
\ No newline at end of file
+    cliente = relationship("Cliente", back_populates="metodos_de_pago")
+
+class Cambio(Base):
+    """Change journal for medicamentos and stock (filled by triggers, see utils/changes.py)"""
+    __tablename__ = "cambios"
+    
+    seq = Column(Integer, primary_key=True)
+    tabla = Column(String(20), nullable=False)       # medicamento | stock
+    operacion = Column(String(10), nullable=False)   # insert | update | delete
+    id_registro = Column(Integer, nullable=False)    # id_medicamento o id_stock
+    id_farmacia = Column(Integer, nullable=True)
+    id_medicamento = Column(Integer, nullable=True)
+    fecha = Column(FechaHora, server_default=func.now())
+    
+    __table_args__ = (
+        # Deltas del stock de una farmacia
+        Index("ix_cambios_farmacia_seq", "id_farmacia", "seq"),
+        # AUTOINCREMENT: SQLite nunca reutiliza un seq
+        {"sqlite_autoincrement": True},
+    )
+
+class RecorteCambios(Base):
+    """Highest journal seq deleted by the retention trim (a single row, see utils/changes.py)"""
+    __tablename__ = "cambios_recorte"
+    
+    id = Column(Integer, primary_key=True)
+    hasta_seq = Column(Integer, nullable=False, default=0)
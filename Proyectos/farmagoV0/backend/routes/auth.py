@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Usuario, Cliente, Farmacia
 from schemas import LoginRequest, TokenResponse, UsuarioCreate, ClienteCreate, FarmaciaCreate
-from utils.security import hash_password, verify_password, create_access_token
+from utils.security import create_access_token
+from utils.hashing import password_hasher
+from utils.rate_limit import login_limiter, client_ip
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
 
+# Las rutas de este archivo son async para poder esperar a bcrypt (que corre en
+# un pool de procesos) sin ocupar un hilo; los accesos a la base, que son
+# sincrónicos, van al threadpool con run_in_threadpool.
+
+def _find_user_by_email(db: Session, email: str):
+    return db.query(Usuario).filter(Usuario.email == email).first()
+
+def _save(db: Session, obj):
+    db.add(obj)
+    db.commit()
+    db.refresh(obj) # ¡Refrescamos el objeto que SÍ creamos!
+    return obj
+
 class RegisterClienteRequest(BaseModel):
     email: EmailStr
     password: str
@@ -43,15 +59,19 @@ class TokenResponse(BaseModel):
     user: dict
 
 @router.post("/login", response_model=TokenResponse)
-def login(credentials: LoginRequest, db: Session = Depends(get_db)):
+async def login(credentials: LoginRequest, request: Request, db: Session = Depends(get_db)):
     """Authenticate user with email and password"""
-    user = db.query(Usuario).filter(Usuario.email == credentials.email).first()
+    # Antes que nada: un intento rechazado no consulta la base ni corre bcrypt
+    login_limiter.check(client_ip(request), credentials.email)
     
-    if not user or not verify_password(credentials.password, user.contraseña):
+    user = await run_in_threadpool(_find_user_by_email, db, credentials.email)
+    
+    if not user or not await password_hasher.verify(credentials.password, user.contraseña):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña inválidos"
         )
+    login_limiter.succeeded(credentials.email)
     
     access_token = create_access_token({"sub": str(user.id_usuario), "tipo": user.tipo_usuario})
     
@@ -72,16 +92,16 @@ def login(credentials: LoginRequest, db: Session = Depends(get_db)):
     }
 
 @router.post("/register/cliente", response_model=TokenResponse)
-def register_cliente(data: RegisterClienteRequest, db: Session = Depends(get_db)):
+async def register_cliente(data: RegisterClienteRequest, db: Session = Depends(get_db)):
     """Register a new client"""
-    existing_user = db.query(Usuario).filter(Usuario.email == data.email).first()
+    existing_user = await run_in_threadpool(_find_user_by_email, db, data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email ya registrado"
         )
     
-    hashed_password = hash_password(data.password)
+    hashed_password = await password_hasher.hash(data.password)
     
     # --- ¡CAMBIO CLAVE! ---
     # ¡Creamos UN SOLO objeto Cliente con TODOS los datos!
@@ -102,9 +122,7 @@ def register_cliente(data: RegisterClienteRequest, db: Session = Depends(get_db)
     )
     
     # ¡Borramos la lógica vieja de 'new_usuario' y 'new_cliente' separados!
-    db.add(new_cliente)
-    db.commit()
-    db.refresh(new_cliente) # ¡Refrescamos el objeto que SÍ creamos!
+    new_cliente = await run_in_threadpool(_save, db, new_cliente)
     
     # ¡El resto del código ahora usa 'new_cliente' en vez de 'new_usuario'!
     access_token = create_access_token({"sub": str(new_cliente.id_usuario), "tipo": "cliente"})
@@ -125,16 +143,16 @@ def register_cliente(data: RegisterClienteRequest, db: Session = Depends(get_db)
     }
 
 @router.post("/register/farmacia", response_model=TokenResponse)
-def register_farmacia(data: RegisterFarmaciaRequest, db: Session = Depends(get_db)):
+async def register_farmacia(data: RegisterFarmaciaRequest, db: Session = Depends(get_db)):
     """Register a new pharmacy"""
-    existing_user = db.query(Usuario).filter(Usuario.email == data.email).first()
+    existing_user = await run_in_threadpool(_find_user_by_email, db, data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email ya registrado"
         )
     
-    hashed_password = hash_password(data.password)
+    hashed_password = await password_hasher.hash(data.password)
     
     # --- ¡CAMBIO CLAVE! ---
     # ¡Creamos UN SOLO objeto Farmacia con TODOS los datos!
@@ -158,9 +176,7 @@ def register_farmacia(data: RegisterFarmaciaRequest, db: Session = Depends(get_d
     )
     
     # ¡Borramos la lógica vieja!
-    db.add(new_farmacia)
-    db.commit()
-    db.refresh(new_farmacia) # ¡Refrescamos el objeto que SÍ creamos!
+    new_farmacia = await run_in_threadpool(_save, db, new_farmacia)
     
     # ¡El resto del código ahora usa 'new_farmacia'!
     access_token = create_access_token({"sub": str(new_farmacia.id_usuario), "tipo": "farmacia"})
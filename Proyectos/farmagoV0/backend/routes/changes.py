@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from typing import Literal
+from database import get_db
+from models import Cambio, Medicamento, RecorteCambios, StockMedicamento
+from utils.changes import safe_upper_bound
+from utils.security import get_current_user, Principal
+
+router = APIRouter()
+
+@router.get("/")
+def get_changes(
+    since: int = Query(0, ge=0),
+    tabla: Literal["medicamento", "stock"] = None,
+    id_farmacia: int = None,
+    limit: int = Query(500, ge=0, le=5000),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Catalog and stock changes after `since`, with the current data of each row"""
+    # El catálogo es para todos; el stock, solo el de la farmacia que pregunta
+    own_farmacia = current_user.id_usuario if current_user.tipo_usuario == "farmacia" else None
+    if own_farmacia is None and (tabla == "stock" or id_farmacia is not None):
+        raise HTTPException(status_code=403, detail="Solo las farmacias ven cambios de stock")
+    if id_farmacia is not None and id_farmacia != own_farmacia:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    # Si se recortó el diario por encima de `since`, le faltan cambios: tiene que bajar todo de nuevo
+    trimmed = db.query(RecorteCambios.hasta_seq).scalar() or 0
+    if since and since < trimmed:
+        raise HTTPException(status_code=410, detail="El cursor es demasiado viejo, hay que sincronizar desde cero")
+    # Con el diario recortado entero MAX(seq) no sirve: la posición es el recorte
+    bound = max(safe_upper_bound(db), trimmed)
+    
+    if limit == 0:
+        # Solo la posición actual del diario (para arrancar después de una descarga completa)
+        return {"cambios": [], "ultimo_seq": max(since, bound), "hay_mas": bound > since}
+    
+    # Un solo query: cada cambio con el estado actual de su fila (NULL si ya no existe)
+    query = (
+        db.query(
+            Cambio.seq, Cambio.tabla, Cambio.operacion, Cambio.id_registro, Cambio.id_farmacia,
+            Cambio.id_medicamento, Cambio.fecha,
+            StockMedicamento.id_stock, StockMedicamento.precio, StockMedicamento.cantidad_disponible,
+            Medicamento
+        )
+        .outerjoin(StockMedicamento, and_(Cambio.tabla == "stock", StockMedicamento.id_stock == Cambio.id_registro))
+        .outerjoin(Medicamento, and_(Cambio.tabla == "medicamento", Medicamento.id_medicamento == Cambio.id_registro))
+        .filter(Cambio.seq > since, Cambio.seq <= bound)
+    )
+    if tabla:
+        query = query.filter(Cambio.tabla == tabla)
+    if id_farmacia is not None:
+        query = query.filter(Cambio.id_farmacia == id_farmacia)
+    elif own_farmacia is not None:
+        query = query.filter(or_(Cambio.tabla == "medicamento", Cambio.id_farmacia == own_farmacia))
+    else:
+        query = query.filter(Cambio.tabla == "medicamento")
+    rows = query.order_by(Cambio.seq).limit(limit + 1).all()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    changes = []
+    for row in rows:
+        if row.tabla == "stock":
+            data = None if row.id_stock is None else {
+                "id_stock": row.id_stock,
+                "id_farmacia": row.id_farmacia,
+                "id_medicamento": row.id_medicamento,
+                "precio": row.precio,
+                "cantidad_disponible": row.cantidad_disponible
+            }
+        else:
+            medicamento = row.Medicamento
+            data = None if medicamento is None else {
+                "id_medicamento": medicamento.id_medicamento,
+                "nombre_comercial": medicamento.nombre_comercial,
+                "principio_activo": medicamento.principio_activo,
+                "presentacion": medicamento.presentacion,
+                "requiere_receta": medicamento.requiere_receta,
+                "laboratorio": medicamento.laboratorio,
+                "categoria": medicamento.categoria
+            }
+        changes.append({
+            "seq": row.seq,
+            "tabla": row.tabla,
+            "operacion": row.operacion,
+            "id": row.id_registro,
+            "fecha": row.fecha,
+            # Estado actual: si la fila cambió varias veces llega el último valor
+            "data": data
+        })
+    
+    return {
+        "cambios": changes,
+        # Próximo `since`: sin más páginas se puede saltar hasta el límite seguro
+        "ultimo_seq": rows[-1].seq if has_more else max(since, bound),
+        "hay_mas": has_more
+    }
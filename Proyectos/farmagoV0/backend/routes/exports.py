@@ -0,0 +1,89 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from models import Medicamento, StockMedicamento, Pedido, DetallePedido
+from utils.security import get_current_user, Principal
+from utils.export import EXPORT_BATCH_SIZE, csv_chunks, export_headers
+from utils.replicas import read_session
+
+router = APIRouter()
+
+STOCK_COLUMNS = [
+    "id_stock", "id_medicamento", "nombre_comercial", "principio_activo", "presentacion",
+    "laboratorio", "categoria", "precio", "cantidad_disponible", "fecha_actualizacion"
+]
+ORDER_COLUMNS = [
+    "id_pedido", "fecha_pedido", "estado", "metodo_pago", "total_pedido", "id_cliente",
+    "id_detalle", "id_medicamento", "nombre_comercial", "cantidad", "precio_unitario"
+]
+
+def _stream_rows(stmt, header, gzip: bool, excel: bool):
+    # Igual que el NDJSON de medicamentos: el generador corre mientras se envía
+    # la respuesta, así que usa su propia sesión.
+    db = read_session()
+    try:
+        # yield_per: cursor del lado del servidor en PostgreSQL, de a EXPORT_BATCH_SIZE filas
+        rows = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        yield from csv_chunks(header, rows, gzip=gzip, excel=excel)
+    finally:
+        db.close()
+
+def _csv_response(stmt, header, filename: str, gzip: bool, excel: bool):
+    return StreamingResponse(
+        _stream_rows(stmt, header, gzip, excel),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers=export_headers(filename, gzip)
+    )
+
+def _require_pharmacy(current_user: Principal):
+    if current_user.tipo_usuario != "farmacia":
+        raise HTTPException(status_code=403, detail="Solo las farmacias pueden exportar")
+
+@router.get("/stock")
+def export_stock(
+    gzip: bool = False,
+    excel: bool = False,
+    current_user: Principal = Depends(get_current_user)
+):
+    """Download the pharmacy's full stock as CSV (gzip=true compresses it, excel=true prepares it for Excel)"""
+    _require_pharmacy(current_user)
+    stmt = (
+        select(
+            StockMedicamento.id_stock, StockMedicamento.id_medicamento,
+            Medicamento.nombre_comercial, Medicamento.principio_activo, Medicamento.presentacion,
+            Medicamento.laboratorio, Medicamento.categoria,
+            StockMedicamento.precio, StockMedicamento.cantidad_disponible, StockMedicamento.fecha_actualizacion
+        )
+        .join(Medicamento, Medicamento.id_medicamento == StockMedicamento.id_medicamento)
+        .where(StockMedicamento.id_farmacia == current_user.id_usuario)
+        .order_by(StockMedicamento.id_stock)
+    )
+    return _csv_response(stmt, STOCK_COLUMNS, f"stock_{current_user.id_usuario}", gzip, excel)
+
+@router.get("/orders")
+def export_orders(
+    desde: datetime = None,
+    hasta: datetime = None,
+    gzip: bool = False,
+    excel: bool = False,
+    current_user: Principal = Depends(get_current_user)
+):
+    """Download the pharmacy's orders as CSV, one row per order line"""
+    _require_pharmacy(current_user)
+    stmt = (
+        select(
+            Pedido.id_pedido, Pedido.fecha_pedido, Pedido.estado, Pedido.metodo_pago, Pedido.total,
+            Pedido.id_cliente, DetallePedido.id_detalle, DetallePedido.id_medicamento,
+            Medicamento.nombre_comercial, DetallePedido.cantidad, DetallePedido.precio_unitario
+        )
+        .join(DetallePedido, DetallePedido.id_pedido == Pedido.id_pedido)
+        .join(Medicamento, Medicamento.id_medicamento == DetallePedido.id_medicamento)
+        .where(Pedido.id_farmacia == current_user.id_usuario)
+        .order_by(Pedido.fecha_pedido, Pedido.id_pedido, DetallePedido.id_detalle)
+    )
+    if desde:
+        stmt = stmt.where(Pedido.fecha_pedido >= desde)
+    if hasta:
+        stmt = stmt.where(Pedido.fecha_pedido < hasta)
+    return _csv_response(stmt, ORDER_COLUMNS, f"pedidos_{current_user.id_usuario}", gzip, excel)
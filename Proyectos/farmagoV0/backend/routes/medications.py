@@ -1,8 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_, func, select
+from typing import List, Literal
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from models import Medicamento, StockMedicamento, Farmacia
-from schemas import MedicamentoCreate, MedicamentoResponse
+from schemas import MedicamentoCreate, MedicamentoResponse, MedicamentoBusquedaResponse, SugerenciaResponse
+from utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, set_next_cursor, keyset_after
+from utils.search import search_ranking, normalize_text
+from utils.suggest import suggest_index
+from utils.catalog_cache import catalog_cache
+from utils.replicas import get_read_db, get_async_read_db, read_session
+from utils.geo import squared_distance_km2, bounding_box, within_radius
 
 router = APIRouter()
 
@@ -13,25 +23,106 @@ def create_medication(medicamento: MedicamentoCreate, db: Session = Depends(get_
     db.add(db_medicamento)
     db.commit()
     db.refresh(db_medicamento)
+    suggest_index.add(db_medicamento.id_medicamento, db_medicamento.nombre_comercial, db_medicamento.principio_activo)
+    catalog_cache.bump()
     return db_medicamento
 
-@router.get("/")
-def list_medications(db: Session = Depends(get_db)):
-    """List all medications"""
-    return db.query(Medicamento).all()
+def _stream_medications(after_id: int):
+    # El generador corre mientras se envía la respuesta, así que usa su propia
+    # sesión en vez de la de get_read_db (que puede cerrarse antes).
+    db = read_session()
+    try:
+        query = (
+            db.query(Medicamento)
+            .filter(Medicamento.id_medicamento > after_id)
+            .order_by(Medicamento.id_medicamento)
+            .yield_per(500)  # cursor del lado del servidor en PostgreSQL
+        )
+        for medicamento in query:
+            yield MedicamentoResponse.model_validate(medicamento).model_dump_json() + "\n"
+    finally:
+        db.close()
 
-@router.get("/search")
-def search_medications(
-    query: str = Query(..., min_length=1),
-    categoria: str = None,
-    requiere_receta: bool = None,
-    db: Session = Depends(get_db)
+def _serialize(medicamentos):
+    return [MedicamentoResponse.model_validate(m).model_dump(mode="json") for m in medicamentos]
+
+# Los statements y el armado de las respuestas se comparten con las versiones
+# async de estas rutas (async_router, ASYNC_DB=true).
+
+def _list_statement(after_id: int, limit: int):
+    return (
+        select(Medicamento)
+        .where(Medicamento.id_medicamento > after_id)
+        .order_by(Medicamento.id_medicamento)
+        .limit(limit + 1)
+    )
+
+def _list_body(page, limit: int):
+    headers = {}
+    if len(page) > limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor({"after_id": page[limit - 1].id_medicamento})
+    return _serialize(page[:limit]), headers
+
+def _list_after_id(cursor: str) -> int:
+    if not cursor:
+        return 0
+    data = decode_cursor(cursor)
+    try:
+        return int(data.get("after_id", 0))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+@router.get("/", response_model=List[MedicamentoResponse])
+def list_medications(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = None,
+    stream: bool = False,
+    db: Session = Depends(get_read_db)
 ):
-    """Search medications by name, active ingredient, or category"""
-    search_filter = Medicamento.nombre_comercial.ilike(f"%{query}%") | \
-                    Medicamento.principio_activo.ilike(f"%{query}%")
+    """List medications ordered by id, one page at a time (or the whole catalog as NDJSON with stream=true)"""
+    after_id = _list_after_id(cursor)
+    
+    if stream:
+        return StreamingResponse(_stream_medications(after_id), media_type="application/x-ndjson")
+    
+    def compute():
+        return _list_body(db.execute(_list_statement(after_id, limit)).scalars().all(), limit)
+    
+    return catalog_cache.respond(request, ("list", after_id, limit), compute)
+
+def _available_nearby(lat: float, lon: float, radius_km: float):
+    """Per medication: min price, nearest distance² and pharmacy count with stock within the radius"""
+    distance2 = squared_distance_km2(Farmacia.latitud, Farmacia.longitud, lat, lon)
+    return (
+        select(
+            StockMedicamento.id_medicamento,
+            func.min(StockMedicamento.precio).label("precio_min"),
+            func.min(distance2).label("distancia2_min"),
+            func.count(StockMedicamento.id_stock).label("farmacias")
+        )
+        .join(Farmacia, Farmacia.id_usuario == StockMedicamento.id_farmacia)
+        .where(StockMedicamento.cantidad_disponible > 0, *within_radius(lat, lon, radius_km))
+        .group_by(StockMedicamento.id_medicamento)
+        .subquery("disponibles")
+    )
+
+def _search_statement(session, query: str, categoria: str, requiere_receta: bool, after, limit: int, point=None):
+    """Select for one page of search results (None if the query has nothing to search)
+
+    `session` solo se usa para armar el Query (en async, AsyncSession.sync_session).
+    `after` son las claves de orden de la última fila de la página anterior.
+    Con point=(lat, lon, radius_km) solo quedan los disponibles cerca.
+    """
+    ranking = search_ranking(session, query)
+    if ranking is None:
+        return None
+    results, keys = ranking
+    # Las claves de orden vuelven en cada fila (orden_0, orden_1, ...) para armar el cursor
+    results = results.add_columns(*(key.label(f"orden_{i}") for i, key in enumerate(keys)))
     
-    results = db.query(Medicamento).filter(search_filter)
+    if after is not None:
+        results = results.filter(keyset_after(keys, after))
     
     if categoria:
         results = results.filter(Medicamento.categoria == categoria)
@@ -39,42 +130,261 @@ def search_medications(
     if requiere_receta is not None:
         results = results.filter(Medicamento.requiere_receta == requiere_receta)
     
-    return results.all()
+    if point:
+        # Un solo query: la búsqueda ⨝ el agregado de stock ⨝ farmacias del radio
+        disponibles = _available_nearby(*point)
+        results = results.join(
+            disponibles, disponibles.c.id_medicamento == Medicamento.id_medicamento
+        ).add_columns(disponibles.c.precio_min, disponibles.c.distancia2_min, disponibles.c.farmacias)
+    
+    return results.limit(limit + 1).statement
 
-@router.get("/{id_medicamento}", response_model=MedicamentoResponse)
-def get_medication(id_medicamento: int, db: Session = Depends(get_db)):
-    """Get medication details by ID"""
-    medicamento = db.query(Medicamento).filter(Medicamento.id_medicamento == id_medicamento).first()
+def _search_after(cursor: str):
+    if not cursor:
+        return None
+    # Claves de orden de la última fila: una lista de escalares. Que sean tantas
+    # como claves tiene el motor de búsqueda y de su tipo lo revisa keyset_after()
+    after = decode_cursor(cursor).get("after")
+    if (not isinstance(after, list) or not after
+            or not all(isinstance(v, (int, float, str)) and not isinstance(v, bool) for v in after)):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return after
+
+def _search_next_cursor(rows, limit: int):
+    """Cursor after the last row of the page, or None if there are no more results"""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]._mapping
+    return {"after": [last[key] for key in last.keys() if key.startswith("orden_")]}
+
+def _search_body(rows, limit: int):
+    headers = {}
+    next_cursor = _search_next_cursor(rows, limit)
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(next_cursor)
+    return _serialize([row.Medicamento for row in rows[:limit]]), headers
+
+def _nearby_search_body(rows, limit: int):
+    return [
+        {
+            **MedicamentoResponse.model_validate(row.Medicamento).model_dump(),
+            "precio_min": row.precio_min,
+            "distancia_km": round(row.distancia2_min ** 0.5, 3),
+            "farmacias_cercanas": row.farmacias
+        }
+        for row in rows[:limit]
+    ]
+
+@router.get("/search", response_model=List[MedicamentoBusquedaResponse], response_model_exclude_unset=True)
+def search_medications(
+    request: Request,
+    response: Response,
+    query: str = Query(..., min_length=1),
+    categoria: str = None,
+    requiere_receta: bool = None,
+    lat: float = Query(None, ge=-90, le=90),
+    lon: float = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=50),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    db: Session = Depends(get_read_db)
+):
+    """Search medications by name or active ingredient, best matches first
+
+    Con lat/lon solo devuelve los que tienen stock en farmacias a menos de
+    radius_km, con el precio mínimo y la distancia a la más cercana.
+    """
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Se requieren lat y lon juntos")
     
+    # Keyset sobre las claves de relevancia (+ id): la página siguiente sigue
+    # desde la última fila, sin OFFSET
+    after = _search_after(cursor)
+    
+    if lat is None:
+        # Sin ubicación el resultado solo depende del catálogo: se cachea
+        def compute():
+            stmt = _search_statement(db, query, categoria, requiere_receta, after, limit)
+            if stmt is None:
+                return [], {}
+            return _search_body(db.execute(stmt).all(), limit)
+        
+        key = ("search", normalize_text(query), categoria, requiere_receta, limit, cursor)
+        return catalog_cache.respond(request, key, compute)
+    
+    stmt = _search_statement(db, query, categoria, requiere_receta, after, limit, (lat, lon, radius_km))
+    if stmt is None:
+        return []
+    rows = db.execute(stmt).all()
+    set_next_cursor(response, _search_next_cursor(rows, limit))
+    return _nearby_search_body(rows, limit)
+
+@router.get("/suggest", response_model=List[SugerenciaResponse])
+async def suggest_medications(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Autocomplete by name or active ingredient prefix (in-memory index, no database query)"""
+    return suggest_index.suggest(q, limit)
+
+def _medication_body(medicamento):
     if not medicamento:
         raise HTTPException(status_code=404, detail="Medicamento no encontrado")
+    return MedicamentoResponse.model_validate(medicamento).model_dump(mode="json"), {}
+
+@router.get("/{id_medicamento}", response_model=MedicamentoResponse)
+def get_medication(id_medicamento: int, request: Request, db: Session = Depends(get_read_db)):
+    """Get medication details by ID"""
+    def compute():
+        return _medication_body(db.get(Medicamento, id_medicamento))
     
-    return medicamento
+    return catalog_cache.respond(request, ("get", id_medicamento), compute)
 
 @router.get("/{id_medicamento}/farmacias")
-def get_pharmacies_with_medication(id_medicamento: int, db: Session = Depends(get_db)):
-    """Get all pharmacies with availability and prices for a medication"""
-    stocks = db.query(StockMedicamento).filter(
-        StockMedicamento.id_medicamento == id_medicamento,
-        StockMedicamento.cantidad_disponible > 0
-    ).all()
-    
-    if not stocks:
-        return []
+def get_pharmacies_with_medication(
+    id_medicamento: int,
+    response: Response,
+    lat: float = Query(None, ge=-90, le=90),
+    lon: float = Query(None, ge=-180, le=180),
+    max_km: float = Query(None, gt=0),
+    sort: Literal["price", "distance"] = "price",
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get pharmacies with availability and prices for a medication, cheapest or nearest first"""
+    has_point = lat is not None and lon is not None
+    if (sort == "distance" or max_km is not None) and not has_point:
+        raise HTTPException(status_code=400, detail="Se requieren lat y lon para filtrar u ordenar por distancia")
+    
+    # Un solo query: stock ⨝ farmacia (usa ix_stock_medicamento_disponible)
+    distance2 = squared_distance_km2(Farmacia.latitud, Farmacia.longitud, lat, lon).label("distancia2") if has_point else None
+    columns = [
+        StockMedicamento.id_stock, StockMedicamento.precio, StockMedicamento.cantidad_disponible,
+        Farmacia.id_usuario, Farmacia.nombre_comercial, Farmacia.latitud, Farmacia.longitud
+    ]
+    query = (
+        db.query(*columns, *([distance2] if has_point else []))
+        .join(Farmacia, Farmacia.id_usuario == StockMedicamento.id_farmacia)
+        .filter(
+            StockMedicamento.id_medicamento == id_medicamento,
+            StockMedicamento.cantidad_disponible > 0
+        )
+    )
+    
+    if max_km is not None:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, max_km)
+        query = query.filter(
+            Farmacia.latitud.between(min_lat, max_lat),
+            Farmacia.longitud.between(min_lon, max_lon),
+            distance2 <= max_km * max_km
+        )
+    
+    # Keyset sobre (precio | distancia², id_stock)
+    sort_key = distance2 if sort == "distance" else StockMedicamento.precio
+    if sort == "distance":
+        query = query.filter(Farmacia.latitud.isnot(None), Farmacia.longitud.isnot(None))
+    if cursor:
+        data = decode_cursor(cursor)
+        try:
+            last_value, last_id = float(data["value"]), int(data["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.filter(or_(
+            sort_key > last_value,
+            and_(sort_key == last_value, StockMedicamento.id_stock > last_id)
+        ))
+    
+    rows = query.order_by(sort_key, StockMedicamento.id_stock).limit(limit + 1).all()
+    
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        last_value = last.distancia2 if sort == "distance" else last.precio
+        set_next_cursor(response, {"value": last_value, "id": last.id_stock})
     
     result = []
-    for stock in stocks:
-        farmacia = db.query(Farmacia).filter(Farmacia.id_usuario == stock.id_farmacia).first()
-        result.append({
-            "id_stock": stock.id_stock,
+    for row in rows[:limit]:
+        item = {
+            "id_stock": row.id_stock,
             "farmacia": {
-                "id_usuario": farmacia.id_usuario,
-                "nombre_comercial": farmacia.nombre_comercial,
-                "latitud": farmacia.latitud,
-                "longitud": farmacia.longitud
+                "id_usuario": row.id_usuario,
+                "nombre_comercial": row.nombre_comercial,
+                "latitud": row.latitud,
+                "longitud": row.longitud
             },
-            "precio": stock.precio,
-            "cantidad_disponible": stock.cantidad_disponible
-        })
+            "precio": row.precio,
+            "cantidad_disponible": row.cantidad_disponible
+        }
+        if has_point:
+            item["distancia_km"] = round(row.distancia2 ** 0.5, 3) if row.distancia2 is not None else None
+        result.append(item)
     
     return result
+
+# --- Versiones async (ASYNC_DB=true; ver without_routes_of en main.py) ---
+async_router = APIRouter()
+
+@async_router.get("/", response_model=List[MedicamentoResponse])
+async def list_medications_async(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """List medications ordered by id, one page at a time (or the whole catalog as NDJSON with stream=true)"""
+    after_id = _list_after_id(cursor)
+    
+    if stream:
+        return StreamingResponse(_stream_medications(after_id), media_type="application/x-ndjson")
+    
+    async def compute():
+        return _list_body((await db.execute(_list_statement(after_id, limit))).scalars().all(), limit)
+    
+    return await catalog_cache.respond_async(request, ("list", after_id, limit), compute)
+
+@async_router.get("/search", response_model=List[MedicamentoBusquedaResponse], response_model_exclude_unset=True)
+async def search_medications_async(
+    request: Request,
+    response: Response,
+    query: str = Query(..., min_length=1),
+    categoria: str = None,
+    requiere_receta: bool = None,
+    lat: float = Query(None, ge=-90, le=90),
+    lon: float = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=50),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Search medications by name or active ingredient, best matches first"""
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Se requieren lat y lon juntos")
+    
+    after = _search_after(cursor)
+    
+    if lat is None:
+        async def compute():
+            stmt = _search_statement(db.sync_session, query, categoria, requiere_receta, after, limit)
+            if stmt is None:
+                return [], {}
+            return _search_body((await db.execute(stmt)).all(), limit)
+        
+        key = ("search", normalize_text(query), categoria, requiere_receta, limit, cursor)
+        return await catalog_cache.respond_async(request, key, compute)
+    
+    stmt = _search_statement(db.sync_session, query, categoria, requiere_receta, after, limit, (lat, lon, radius_km))
+    if stmt is None:
+        return []
+    rows = (await db.execute(stmt)).all()
+    set_next_cursor(response, _search_next_cursor(rows, limit))
+    return _nearby_search_body(rows, limit)
+
+# {id:int}: así "/suggest" (que sigue en el router sync) no cae en esta ruta
+@async_router.get("/{id_medicamento:int}", response_model=MedicamentoResponse)
+async def get_medication_async(id_medicamento: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    """Get medication details by ID"""
+    async def compute():
+        return _medication_body(await db.get(Medicamento, id_medicamento))
+    
+    return await catalog_cache.respond_async(request, ("get", id_medicamento), compute)
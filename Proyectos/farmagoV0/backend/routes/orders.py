@@ -1,36 +1,87 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import update, or_, and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List
+import asyncio
+import json
 from database import get_db
-from models import Pedido, DetallePedido, Cliente, StockMedicamento, Medicamento
-from schemas import PedidoCreate, PedidoResponse
-from utils.security import get_current_user
+from models import Pedido, DetallePedido, Cliente, StockMedicamento, Farmacia
+from schemas import PedidoCreate, PedidoResponse, PedidoDetalleResponse, ColaPedidosResponse
+from utils.security import get_current_user, decode_access_token, optional_security
+from utils.events import broker, user_channel
+from utils.idempotency import run_idempotent
+from utils.pagination import decode_cursor, set_next_cursor
+from utils.replicas import get_read_db, get_async_read_db
 
 router = APIRouter()
 
+# Cada cuánto se manda un comentario en el stream SSE para detectar clientes caídos
+SSE_HEARTBEAT_SECONDS = 15
+
 @router.post("/", response_model=PedidoResponse)
 def create_order(
     pedido: PedidoCreate,
+    response: Response,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: str = Header(None, alias="Idempotency-Key")
 ):
-    """Create a new medication order"""
+    """Create a new medication order (retries with the same Idempotency-Key return the first result)"""
+    return run_idempotent(
+        "orders", current_user.id_usuario, idempotency_key, pedido, response,
+        lambda: PedidoResponse.model_validate(_create_order(pedido, current_user, db))
+    )
+
+def _create_order(pedido: PedidoCreate, current_user, db: Session):
     # Verify current user is a cliente
     cliente = db.query(Cliente).filter(Cliente.id_usuario == current_user.id_usuario).first()
     if not cliente:
         raise HTTPException(status_code=403, detail="Solo los clientes pueden crear pedidos")
     
-    # Calculate total and verify stock
-    total = 0.0
+    # Juntamos las líneas repetidas del mismo medicamento
+    cantidades = {}
     for detalle in pedido.detalles:
-        stock = db.query(StockMedicamento).filter(
+        if detalle.cantidad <= 0:
+            raise HTTPException(status_code=400, detail="La cantidad debe ser mayor a cero")
+        cantidades[detalle.id_medicamento] = cantidades.get(detalle.id_medicamento, 0) + detalle.cantidad
+    if not cantidades:
+        raise HTTPException(status_code=400, detail="El pedido no tiene detalles")
+    
+    # Todo el stock del pedido en un solo query
+    stocks = {
+        stock.id_medicamento: stock
+        for stock in db.query(StockMedicamento).filter(
             StockMedicamento.id_farmacia == pedido.id_farmacia,
-            StockMedicamento.id_medicamento == detalle.id_medicamento
-        ).first()
-        
-        if not stock or stock.cantidad_disponible < detalle.cantidad:
+            StockMedicamento.id_medicamento.in_(cantidades)
+        )
+    }
+    
+    total = 0.0
+    for id_medicamento, cantidad in cantidades.items():
+        stock = stocks.get(id_medicamento)
+        if not stock or stock.cantidad_disponible < cantidad:
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+        total += stock.precio * cantidad
+    
+    # Descuento atómico: el UPDATE solo toca la fila si todavía alcanza, así dos
+    # compras simultáneas no pueden vender la misma unidad. Se recorre en orden
+    # de id_stock para que los locks se tomen siempre en el mismo orden.
+    for id_medicamento in sorted(cantidades, key=lambda m: stocks[m].id_stock):
+        result = db.execute(
+            update(StockMedicamento)
+            .where(
+                StockMedicamento.id_stock == stocks[id_medicamento].id_stock,
+                StockMedicamento.cantidad_disponible >= cantidades[id_medicamento]
+            )
+            .values(cantidad_disponible=StockMedicamento.cantidad_disponible - cantidades[id_medicamento])
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
             raise HTTPException(status_code=400, detail="Stock insuficiente")
-        
-        total += stock.precio * detalle.cantidad
     
     new_pedido = Pedido(
         id_cliente=current_user.id_usuario,
@@ -41,40 +92,164 @@ def create_order(
     db.add(new_pedido)
     db.flush()
     
-    # Add order details and reduce stock
-    for detalle in pedido.detalles:
-        stock = db.query(StockMedicamento).filter(
-            StockMedicamento.id_farmacia == pedido.id_farmacia,
-            StockMedicamento.id_medicamento == detalle.id_medicamento
-        ).first()
-        
-        medicamento = db.query(Medicamento).filter(Medicamento.id_medicamento == detalle.id_medicamento).first()
-        
-        detail_record = DetallePedido(
+    db.add_all([
+        DetallePedido(
             id_pedido=new_pedido.id_pedido,
-            id_medicamento=detalle.id_medicamento,
-            cantidad=detalle.cantidad,
-            precio_unitario=stock.precio
+            id_medicamento=id_medicamento,
+            cantidad=cantidad,
+            precio_unitario=stocks[id_medicamento].precio
         )
-        db.add(detail_record)
-        stock.cantidad_disponible -= detalle.cantidad
+        for id_medicamento, cantidad in cantidades.items()
+    ])
     
     db.commit()
     db.refresh(new_pedido)
+    
+    broker.publish(
+        [user_channel(new_pedido.id_cliente), user_channel(new_pedido.id_farmacia)],
+        "pedido_creado",
+        {"id_pedido": new_pedido.id_pedido, "estado": new_pedido.estado}
+    )
     return new_pedido
 
-@router.get("/")
-def get_orders(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get all orders for current client"""
-    cliente = db.query(Cliente).filter(Cliente.id_usuario == current_user.id_usuario).first()
-    if not cliente:
+def _orders_statement(id_cliente: int, estado: str, desde: datetime, hasta: datetime, limit: int, cursor: str):
+    stmt = select(Pedido).where(Pedido.id_cliente == id_cliente)
+    if estado:
+        stmt = stmt.where(Pedido.estado == estado)
+    if desde:
+        stmt = stmt.where(Pedido.fecha_pedido >= desde)
+    if hasta:
+        stmt = stmt.where(Pedido.fecha_pedido < hasta)
+    
+    # Keyset sobre (fecha_pedido, id_pedido) descendente, usa ix_pedidos_cliente_fecha
+    if cursor:
+        data = decode_cursor(cursor)
+        try:
+            last_fecha, last_id = datetime.fromisoformat(data["fecha"]), int(data["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        stmt = stmt.where(or_(
+            Pedido.fecha_pedido < last_fecha,
+            and_(Pedido.fecha_pedido == last_fecha, Pedido.id_pedido < last_id)
+        ))
+    
+    # Detalles y farmacia en dos queries extra por página (no uno por pedido)
+    return (
+        stmt.options(
+            selectinload(Pedido.detalles),
+            selectinload(Pedido.farmacia).load_only(Farmacia.id_usuario, Farmacia.nombre_comercial)
+        )
+        .order_by(Pedido.fecha_pedido.desc(), Pedido.id_pedido.desc())
+        .limit(limit + 1)
+    )
+
+def _orders_page(pedidos, response: Response, limit: int):
+    if len(pedidos) > limit:
+        last = pedidos[limit - 1]
+        set_next_cursor(response, {"fecha": last.fecha_pedido.isoformat(), "id": last.id_pedido})
+    return pedidos[:limit]
+
+@router.get("/", response_model=List[PedidoDetalleResponse])
+def get_orders(
+    response: Response,
+    estado: str = None,
+    desde: datetime = None,
+    hasta: datetime = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get the current client's orders, newest first, with their details and pharmacy"""
+    if current_user.tipo_usuario != "cliente":
         raise HTTPException(status_code=403, detail="Solo los clientes pueden ver pedidos")
     
-    pedidos = db.query(Pedido).filter(Pedido.id_cliente == current_user.id_usuario).all()
-    return pedidos
+    stmt = _orders_statement(current_user.id_usuario, estado, desde, hasta, limit, cursor)
+    return _orders_page(db.execute(stmt).scalars().all(), response, limit)
+
+@router.get("/pharmacy/queue", response_model=ColaPedidosResponse)
+def get_pharmacy_queue(
+    response: Response,
+    estado: str = "pendiente",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get the current pharmacy's orders in a state (oldest first) plus counts per state"""
+    if current_user.tipo_usuario != "farmacia":
+        raise HTTPException(status_code=403, detail="Solo las farmacias pueden ver su cola de pedidos")
+    
+    # Todo sale de ix_pedidos_farmacia_estado_fecha
+    conteos = dict(
+        db.query(Pedido.estado, func.count(Pedido.id_pedido))
+        .filter(Pedido.id_farmacia == current_user.id_usuario)
+        .group_by(Pedido.estado)
+        .all()
+    )
+    
+    query = db.query(Pedido).filter(
+        Pedido.id_farmacia == current_user.id_usuario,
+        Pedido.estado == estado
+    )
+    if cursor:
+        data = decode_cursor(cursor)
+        try:
+            last_fecha, last_id = datetime.fromisoformat(data["fecha"]), int(data["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.filter(or_(
+            Pedido.fecha_pedido > last_fecha,
+            and_(Pedido.fecha_pedido == last_fecha, Pedido.id_pedido > last_id)
+        ))
+    
+    pedidos = (
+        query.options(selectinload(Pedido.detalles))
+        .order_by(Pedido.fecha_pedido, Pedido.id_pedido)
+        .limit(limit + 1)
+        .all()
+    )
+    
+    if len(pedidos) > limit:
+        last = pedidos[limit - 1]
+        set_next_cursor(response, {"fecha": last.fecha_pedido.isoformat(), "id": last.id_pedido})
+    return {"conteos": conteos, "pedidos": pedidos[:limit]}
+
+@router.get("/events")
+async def order_events(request: Request, token: str = None, credentials = Depends(optional_security)):
+    """Server-Sent Events stream with the current user's order changes (replaces polling)"""
+    # EventSource no permite mandar headers, por eso también se acepta ?token=
+    raw_token = credentials.credentials if credentials else token
+    if not raw_token:
+        raise HTTPException(status_code=401, detail="Token requerido")
+    # No usamos get_current_user: el stream queda abierto mucho tiempo y no
+    # debe retener una conexión del pool.
+    channel = user_channel(int(decode_access_token(raw_token)["sub"]))
+    subscription = broker.subscribe(channel)
+    
+    async def stream():
+        try:
+            yield ": conectado\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            broker.unsubscribe(channel, subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/{id_pedido}")
-def get_order(id_pedido: int, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_order(id_pedido: int, current_user = Depends(get_current_user), db: Session = Depends(get_read_db)):
     """Get order details"""
     pedido = db.query(Pedido).filter(Pedido.id_pedido == id_pedido).first()
     
@@ -104,4 +279,32 @@ def update_order_status(
     
     pedido.estado = status_data["estado"]
     db.commit()
+    
+    # Avisamos a las pantallas abiertas del cliente y de la farmacia
+    broker.publish(
+        [user_channel(pedido.id_cliente), user_channel(pedido.id_farmacia)],
+        "estado_pedido",
+        {"id_pedido": pedido.id_pedido, "estado": pedido.estado}
+    )
     return {"message": "Estado actualizado"}
+
+# --- Versiones async (ASYNC_DB=true; ver without_routes_of en main.py) ---
+async_router = APIRouter()
+
+@async_router.get("/", response_model=List[PedidoDetalleResponse])
+async def get_orders_async(
+    response: Response,
+    estado: str = None,
+    desde: datetime = None,
+    hasta: datetime = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get the current client's orders, newest first, with their details and pharmacy"""
+    if current_user.tipo_usuario != "cliente":
+        raise HTTPException(status_code=403, detail="Solo los clientes pueden ver pedidos")
+    
+    stmt = _orders_statement(current_user.id_usuario, estado, desde, hasta, limit, cursor)
+    return _orders_page((await db.execute(stmt)).scalars().all(), response, limit)
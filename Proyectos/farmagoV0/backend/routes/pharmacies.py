@@ -1,14 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from typing import Literal
 from database import get_db
-from models import Farmacia, StockMedicamento
-from schemas import StockMedicamentoCreate, StockMedicamentoResponse
-from utils.security import get_current_user
+from models import Farmacia, Medicamento, StockMedicamento
+from schemas import StockMedicamentoCreate, StockBulkResponse, StockSnapshotResponse
+from utils.security import get_current_user, Principal
+from utils.replicas import get_read_db, get_async_read_db
+from utils.geo import squared_distance_km2, within_radius
+from utils.pagination import decode_cursor, set_next_cursor
+from utils.search import escape_like, normalize_text
+from utils.inventory import (
+    BULK_STOCK_BATCH_SIZE, read_stock_rows, validate_stock_rows, upsert_stock, reconcile_snapshot
+)
 
 router = APIRouter()
 
+# Búsqueda k-nearest sin radio: se arranca con un círculo chico y se duplica
+# hasta juntar k farmacias (o llegar al máximo).
+KNN_START_KM = 2.0
+KNN_MAX_KM = 500.0
+
+def _pharmacies_within(lat: float, lon: float, radius_km: float, limit: int):
+    distance2 = squared_distance_km2(Farmacia.latitud, Farmacia.longitud, lat, lon).label("distancia2")
+    return (
+        select(
+            Farmacia.id_usuario, Farmacia.nombre_comercial, Farmacia.direccion,
+            Farmacia.horario_apertura, Farmacia.horario_cierre,
+            Farmacia.latitud, Farmacia.longitud, distance2
+        )
+        .where(*within_radius(lat, lon, radius_km))
+        .order_by(distance2, Farmacia.id_usuario)
+        .limit(limit)
+    )
+
+def _nearby_body(rows):
+    return [
+        {
+            "id_usuario": row.id_usuario,
+            "nombre_comercial": row.nombre_comercial,
+            "direccion": row.direccion,
+            "horario_apertura": row.horario_apertura,
+            "horario_cierre": row.horario_cierre,
+            "latitud": row.latitud,
+            "longitud": row.longitud,
+            "distancia_km": round(row.distancia2 ** 0.5, 3)
+        }
+        for row in rows
+    ]
+
+@router.get("/nearby")
+def get_nearby_pharmacies(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    radius_km: float = Query(None, gt=0, le=KNN_MAX_KM),
+    db: Session = Depends(get_read_db)
+):
+    """Nearest pharmacies to a point: the k closest, or the k closest within radius_km"""
+    if radius_km is not None:
+        rows = db.execute(_pharmacies_within(lat, lon, radius_km, k)).all()
+    else:
+        radius = KNN_START_KM
+        while True:
+            rows = db.execute(_pharmacies_within(lat, lon, radius, k)).all()
+            if len(rows) >= k or radius >= KNN_MAX_KM:
+                break
+            radius = min(radius * 2, KNN_MAX_KM)
+    
+    return _nearby_body(rows)
+
 @router.get("/{id_farmacia}")
-def get_pharmacy(id_farmacia: int, db: Session = Depends(get_db)):
+def get_pharmacy(id_farmacia: int, db: Session = Depends(get_read_db)):
     """Get pharmacy details"""
     farmacia = db.query(Farmacia).filter(Farmacia.id_usuario == id_farmacia).first()
     
@@ -50,11 +115,216 @@ def update_stock(
     db.commit()
     return {"message": "Stock actualizado"}
 
+def _apply_bulk_stock(db: Session, id_farmacia: int, rows: list) -> dict:
+    valid, results = validate_stock_rows(db, rows)
+    
+    ids = list(valid)
+    existing = set()
+    for start in range(0, len(ids), BULK_STOCK_BATCH_SIZE):
+        batch = ids[start:start + BULK_STOCK_BATCH_SIZE]
+        existing.update(
+            id for (id,) in db.query(StockMedicamento.id_medicamento).filter(
+                StockMedicamento.id_farmacia == id_farmacia,
+                StockMedicamento.id_medicamento.in_(batch)
+            )
+        )
+    
+    upsert_stock(db, [
+        {
+            "id_farmacia": id_farmacia,
+            "id_medicamento": item.id_medicamento,
+            "precio": item.precio,
+            "cantidad_disponible": item.cantidad_disponible
+        }
+        for _, item in valid.values()
+    ])
+    db.commit()
+    
+    for fila, item in valid.values():
+        estado = "actualizado" if item.id_medicamento in existing else "insertado"
+        results.append({"fila": fila, "id_medicamento": item.id_medicamento, "estado": estado, "detalle": None})
+    results.sort(key=lambda r: r["fila"])
+    
+    return {
+        "insertados": sum(r["estado"] == "insertado" for r in results),
+        "actualizados": sum(r["estado"] == "actualizado" for r in results),
+        "errores": sum(r["estado"] == "error" for r in results),
+        "resultados": results
+    }
+
+@router.post("/stock/bulk", response_model=StockBulkResponse)
+async def bulk_update_stock(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upsert many stock rows at once (JSON array or CSV with id_medicamento,precio,cantidad_disponible)"""
+    if current_user.tipo_usuario != "farmacia":
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    rows = await read_stock_rows(request)
+    return await run_in_threadpool(_apply_bulk_stock, db, current_user.id_usuario, rows)
+
+def _apply_snapshot(db: Session, id_farmacia: int, rows: list, dry_run: bool) -> dict:
+    valid, results = validate_stock_rows(db, rows)
+    errors = [r for r in results if r["estado"] == "error"]
+    if errors:
+        # Una fila inválida en un snapshot terminaría poniendo ese medicamento en cero
+        raise HTTPException(
+            status_code=422,
+            detail={"mensaje": "El snapshot tiene filas inválidas, no se aplicó nada", "errores": errors}
+        )
+    return reconcile_snapshot(db, id_farmacia, valid, dry_run)
+
+@router.put("/stock/snapshot", response_model=StockSnapshotResponse)
+async def reconcile_stock_snapshot(
+    request: Request,
+    dry_run: bool = False,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Replace the pharmacy inventory with a full snapshot, writing only the differences"""
+    if current_user.tipo_usuario != "farmacia":
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    rows = await read_stock_rows(request)
+    return await run_in_threadpool(_apply_snapshot, db, current_user.id_usuario, rows, dry_run)
+
+# Orden del inventario: columna de la clave y cómo leerla del cursor
+INVENTORY_SORT_KEYS = {
+    "name": (Medicamento.nombre_comercial, str),
+    "stock": (StockMedicamento.cantidad_disponible, int),
+    "price": (StockMedicamento.precio, float),
+}
+
+def _inventory_statement(id_farmacia: int, low_stock_below: int, categoria: str, q: str,
+                         sort: str, order: str, limit: int, cursor: str):
+    # Un solo query: stock ⨝ medicamento
+    stmt = (
+        select(
+            StockMedicamento.id_stock, StockMedicamento.id_farmacia, StockMedicamento.id_medicamento,
+            StockMedicamento.precio, StockMedicamento.cantidad_disponible, StockMedicamento.fecha_actualizacion,
+            Medicamento.nombre_comercial, Medicamento.principio_activo, Medicamento.presentacion,
+            Medicamento.laboratorio, Medicamento.categoria, Medicamento.requiere_receta
+        )
+        .join(Medicamento, Medicamento.id_medicamento == StockMedicamento.id_medicamento)
+        .where(StockMedicamento.id_farmacia == id_farmacia)
+    )
+    
+    if low_stock_below is not None:
+        stmt = stmt.where(StockMedicamento.cantidad_disponible < low_stock_below)
+    if categoria:
+        stmt = stmt.where(Medicamento.categoria == categoria)
+    if q:
+        # texto_busqueda empieza con el nombre comercial normalizado (sin acentos, minúsculas)
+        stmt = stmt.where(Medicamento.texto_busqueda.like(f"{escape_like(normalize_text(q))}%", escape="\\"))
+    
+    # Keyset sobre (clave de orden, id_stock), en el sentido pedido
+    sort_key, cast = INVENTORY_SORT_KEYS[sort]
+    descending = order == "desc"
+    if cursor:
+        data = decode_cursor(cursor)
+        try:
+            last_value, last_id = cast(data["value"]), int(data["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        if descending:
+            stmt = stmt.where(or_(
+                sort_key < last_value,
+                and_(sort_key == last_value, StockMedicamento.id_stock < last_id)
+            ))
+        else:
+            stmt = stmt.where(or_(
+                sort_key > last_value,
+                and_(sort_key == last_value, StockMedicamento.id_stock > last_id)
+            ))
+    
+    if descending:
+        stmt = stmt.order_by(sort_key.desc(), StockMedicamento.id_stock.desc())
+    else:
+        stmt = stmt.order_by(sort_key, StockMedicamento.id_stock)
+    return stmt.limit(limit + 1)
+
+def _inventory_body(rows, response: Response, sort: str, limit: int):
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        last_value = {"name": last.nombre_comercial, "stock": last.cantidad_disponible, "price": last.precio}[sort]
+        set_next_cursor(response, {"value": last_value, "id": last.id_stock})
+    
+    return [
+        {
+            "id_stock": row.id_stock,
+            "id_farmacia": row.id_farmacia,
+            "id_medicamento": row.id_medicamento,
+            "precio": row.precio,
+            "cantidad_disponible": row.cantidad_disponible,
+            "fecha_actualizacion": row.fecha_actualizacion,
+            "medicamento": {
+                "nombre_comercial": row.nombre_comercial,
+                "principio_activo": row.principio_activo,
+                "presentacion": row.presentacion,
+                "laboratorio": row.laboratorio,
+                "categoria": row.categoria,
+                "requiere_receta": row.requiere_receta
+            }
+        }
+        for row in rows[:limit]
+    ]
+
 @router.get("/inventory/{id_farmacia}")
-def get_inventory(id_farmacia: int, db: Session = Depends(get_db)):
-    """Get all medications in pharmacy inventory"""
-    stocks = db.query(StockMedicamento).filter(
-        StockMedicamento.id_farmacia == id_farmacia
-    ).all()
+def get_inventory(
+    id_farmacia: int,
+    response: Response,
+    low_stock_below: int = Query(None, ge=0),
+    categoria: str = None,
+    q: str = Query(None, min_length=1, max_length=100),
+    sort: Literal["name", "stock", "price"] = "name",
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get pharmacy inventory with medication data (filters, sorting and cursor pagination)"""
+    stmt = _inventory_statement(id_farmacia, low_stock_below, categoria, q, sort, order, limit, cursor)
+    return _inventory_body(db.execute(stmt).all(), response, sort, limit)
+
+# --- Versiones async (ASYNC_DB=true; ver without_routes_of en main.py) ---
+async_router = APIRouter()
+
+@async_router.get("/nearby")
+async def get_nearby_pharmacies_async(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    radius_km: float = Query(None, gt=0, le=KNN_MAX_KM),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Nearest pharmacies to a point: the k closest, or the k closest within radius_km"""
+    if radius_km is not None:
+        rows = (await db.execute(_pharmacies_within(lat, lon, radius_km, k))).all()
+    else:
+        radius = KNN_START_KM
+        while True:
+            rows = (await db.execute(_pharmacies_within(lat, lon, radius, k))).all()
+            if len(rows) >= k or radius >= KNN_MAX_KM:
+                break
+            radius = min(radius * 2, KNN_MAX_KM)
     
-    return stocks
+    return _nearby_body(rows)
+
+@async_router.get("/inventory/{id_farmacia}")
+async def get_inventory_async(
+    id_farmacia: int,
+    response: Response,
+    low_stock_below: int = Query(None, ge=0),
+    categoria: str = None,
+    q: str = Query(None, min_length=1, max_length=100),
+    sort: Literal["name", "stock", "price"] = "name",
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get pharmacy inventory with medication data (filters, sorting and cursor pagination)"""
+    stmt = _inventory_statement(id_farmacia, low_stock_below, categoria, q, sort, order, limit, cursor)
+    return _inventory_body((await db.execute(stmt)).all(), response, sort, limit)
@@ -1,19 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Receta, DetalleReceta, Medicamento, Cliente
 from schemas import RecetaCreate, RecetaResponse
 from utils.security import get_current_user
+from utils.idempotency import run_idempotent
+from utils.replicas import get_read_db
 
 router = APIRouter()
 
 @router.post("/", response_model=RecetaResponse)
 def create_recipe(
     receta: RecetaCreate,
+    response: Response,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: str = Header(None, alias="Idempotency-Key")
 ):
-    """Create a new medical recipe"""
+    """Create a new medical recipe (retries with the same Idempotency-Key return the first result)"""
+    return run_idempotent(
+        "recipes", current_user.id_usuario, idempotency_key, receta, response,
+        lambda: RecetaResponse.model_validate(_create_recipe(receta, current_user, db))
+    )
+
+def _create_recipe(receta: RecetaCreate, current_user, db: Session):
     # Verify current user is a cliente
     cliente = db.query(Cliente).filter(Cliente.id_usuario == current_user.id_usuario).first()
     if not cliente:
@@ -46,7 +56,7 @@ def create_recipe(
     return new_receta
 
 @router.get("/")
-def get_recipes(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_recipes(current_user = Depends(get_current_user), db: Session = Depends(get_read_db)):
     """Get all recipes for current client"""
     cliente = db.query(Cliente).filter(Cliente.id_usuario == current_user.id_usuario).first()
     if not cliente:
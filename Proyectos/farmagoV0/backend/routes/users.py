@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import os
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import select, update
 from database import get_db
 from typing import Union
@@ -11,30 +14,62 @@ from schemas import (
     DireccionResponse, DireccionCreate,
     MetodoDePagoResponse, MetodoDePagoCreate # <-- ¡Agregamos los schemas de Direccion!
 )
-from utils.security import get_current_user, hash_password, verify_password
+from utils.security import get_current_user, invalidate_principal, Principal
+from utils.hashing import password_hasher
+from utils.cache import TTLCache, make_etag, etag_matches
+from utils.replicas import get_read_db
 
 router = APIRouter()
 
+# Perfil ya serializado (etag, body) por usuario. Lo invalidan las rutas de
+# este archivo que modifican el perfil, las direcciones o los métodos de pago
+# (entre workers, ver TTLCache en utils/cache.py).
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "30"))
+_profile_cache = TTLCache(maxsize=10000, ttl=PROFILE_CACHE_TTL_SECONDS)
+
+def invalidate_profile(id_usuario: int):
+    _profile_cache.pop(id_usuario)
+
 # --- GET PERFIL (Ya estaba OK, solo nos aseguramos que el response_model cargue todo) ---
 @router.get("/profile", response_model=ClienteResponse | FarmaciaResponse)
-def get_profile(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_profile(request: Request, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
     """Get current authenticated user profile (con direcciones y pagos)"""
     
-    if current_user.tipo_usuario == "cliente":
-        # Gracias a SQLAlchemy y 'from_attributes', esto ahora trae
-        # el cliente CON sus listas de 'direcciones' y 'metodos_de_pago'
-        cliente = db.query(Cliente).filter(Cliente.id_usuario == current_user.id_usuario).first()
-        return cliente
-    else:
-        # (Lo mismo para Farmacia si tuviera listas)
-        farmacia = db.query(Farmacia).filter(Farmacia.id_usuario == current_user.id_usuario).first()
-        return farmacia
+    cached = _profile_cache.get(current_user.id_usuario)
+    if cached is None:
+        if current_user.tipo_usuario == "cliente":
+            # El cliente CON sus 'direcciones' y 'metodos_de_pago': un query por
+            # lista con IN (...). Dos joinedload de colecciones multiplicarían
+            # filas (direcciones x métodos de pago).
+            user = (
+                db.query(Cliente)
+                .options(selectinload(Cliente.direcciones), selectinload(Cliente.metodos_de_pago))
+                .filter(Cliente.id_usuario == current_user.id_usuario)
+                .first()
+            )
+            schema = ClienteResponse
+        else:
+            user = db.query(Farmacia).filter(Farmacia.id_usuario == current_user.id_usuario).first()
+            schema = FarmaciaResponse
+        
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        
+        body = schema.model_validate(user).model_dump(mode="json")
+        cached = (make_etag(body), body)
+        _profile_cache.set(current_user.id_usuario, cached)
+    
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
 
 # --- UPDATE PERFIL (Ahora es más robusto y usa ClienteUpdate) ---
 @router.put("/profile", response_model=ClienteResponse | FarmaciaResponse)
 def update_profile(
     update_data: Union[ClienteUpdate, FarmaciaUpdate], # <-- ¡LA MAGIA ESTÁ ACÁ!
-    current_user: Usuario = Depends(get_current_user), 
+    current_user: Principal = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     """Update user profile information (Cliente o Farmacia)"""
@@ -67,21 +102,24 @@ def update_profile(
             setattr(user, field, value)
     
     db.commit()
+    invalidate_principal(user.id_usuario)
+    invalidate_profile(user.id_usuario)
     db.refresh(user)
     return user
 
 # --- ¡NUEVO! CAMBIAR CONTRASEÑA ---
 @router.post("/profile/change-password")
-def change_password(request: ChangePasswordRequest, current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+async def change_password(request: ChangePasswordRequest, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     """Change user password"""
+    # Es async para esperar a bcrypt (pool de procesos); la base va por el threadpool
     
     # 1. Buscamos al usuario (aunque ya lo tenemos en current_user, lo traemos de la db)
-    user = db.query(Usuario).filter(Usuario.id_usuario == current_user.id_usuario).first()
+    user = await run_in_threadpool(db.get, Usuario, current_user.id_usuario)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # 2. Verificamos la contraseña actual
-    if not verify_password(request.contraseña_actual, user.contraseña):
+    if not await password_hasher.verify(request.contraseña_actual, user.contraseña):
         raise HTTPException(status_code=400, detail="La contraseña actual es incorrecta")
         
     # 3. Validamos la contraseña nueva (¡Tu requisito de 8 dígitos!)
@@ -89,14 +127,15 @@ def change_password(request: ChangePasswordRequest, current_user: Usuario = Depe
         raise HTTPException(status_code=400, detail="La nueva contraseña debe tener al menos 8 caracteres")
 
     # 4. Hasheamos y guardamos la nueva
-    user.contraseña = hash_password(request.nueva_contraseña)
+    user.contraseña = await password_hasher.hash(request.nueva_contraseña)
     
-    db.commit()
+    await run_in_threadpool(db.commit)
+    invalidate_principal(current_user.id_usuario)
     return {"message": "Contraseña actualizada exitosamente"}
 
 # --- ¡NUEVO! ELIMINAR CUENTA ---
 @router.delete("/profile")
-def delete_account(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_account(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     """Delete user account"""
     
     # (Idealmente, acá pediríamos re-autenticar la contraseña)
@@ -115,13 +154,15 @@ def delete_account(current_user: Usuario = Depends(get_current_user), db: Sessio
     # al borrar el Cliente, se borran sus direcciones, pagos, pedidos, etc.
     db.delete(user)
     db.commit()
+    invalidate_principal(current_user.id_usuario)
+    invalidate_profile(current_user.id_usuario)
     
     return {"message": "Cuenta eliminada exitosamente"}
 
 @router.post("/profile/addresses", response_model=DireccionResponse)
 def create_address(
     address_data: DireccionCreate, 
-    current_user: Usuario = Depends(get_current_user), 
+    current_user: Principal = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     """Crea una nueva dirección para el cliente logueado"""
@@ -140,6 +181,7 @@ def create_address(
     )
     db.add(new_address)
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     db.refresh(new_address)
     return new_address
 
@@ -147,7 +189,7 @@ def create_address(
 def update_address(
     id_direccion: int,
     address_data: DireccionCreate, # Reusamos el schema de 'Create' para 'Update'
-    current_user: Usuario = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Actualiza una dirección existente"""
@@ -174,13 +216,14 @@ def update_address(
         setattr(address, field, value)
         
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     db.refresh(address)
     return address
 
 @router.delete("/profile/addresses/{id_direccion}")
 def delete_address(
     id_direccion: int,
-    current_user: Usuario = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Elimina una dirección"""
@@ -208,12 +251,13 @@ def delete_address(
 
     db.delete(address)
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     return {"message": "Dirección eliminada exitosamente"}
 
 @router.post("/profile/payment-methods", response_model=MetodoDePagoResponse)
 def create_payment_method(
     payment_data: MetodoDePagoCreate, 
-    current_user: Usuario = Depends(get_current_user), 
+    current_user: Principal = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     """Crea un nuevo método de pago para el cliente logueado"""
@@ -232,6 +276,7 @@ def create_payment_method(
     )
     db.add(new_payment)
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     db.refresh(new_payment)
     return new_payment
 
@@ -239,7 +284,7 @@ def create_payment_method(
 def update_payment_method(
     id_metodo_pago: int,
     payment_data: MetodoDePagoCreate, # Reusamos el schema de 'Create'
-    current_user: Usuario = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Actualiza un método de pago existente"""
@@ -263,13 +308,14 @@ def update_payment_method(
         setattr(payment, field, value)
         
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     db.refresh(payment)
     return payment
 
 @router.delete("/profile/payment-methods/{id_metodo_pago}")
 def delete_payment_method(
     id_metodo_pago: int,
-    current_user: Usuario = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Elimina un método de pago"""
@@ -296,4 +342,5 @@ def delete_payment_method(
 
     db.delete(payment)
     db.commit()
+    invalidate_profile(current_user.id_usuario)
     return {"message": "Método de pago eliminado exitosamente"}
\ No newline at end of file
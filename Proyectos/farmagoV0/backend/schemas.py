@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class UsuarioBase(BaseModel):
     nombre: str
@@ -69,6 +69,17 @@ class MedicamentoResponse(MedicamentoBase):
     class Config:
         from_attributes = True
 
+class MedicamentoBusquedaResponse(MedicamentoResponse):
+    # Solo en la búsqueda con lat/lon (disponibles cerca); si no, no se envían
+    precio_min: Optional[float] = None
+    distancia_km: Optional[float] = None
+    farmacias_cercanas: Optional[int] = None
+
+class SugerenciaResponse(BaseModel):
+    id_medicamento: int
+    nombre_comercial: str
+    principio_activo: str
+
 class StockMedicamentoBase(BaseModel):
     precio: float
     cantidad_disponible: int
@@ -85,6 +96,25 @@ class StockMedicamentoResponse(StockMedicamentoBase):
     class Config:
         from_attributes = True
 
+class StockBulkResultado(BaseModel):
+    fila: int
+    id_medicamento: Optional[int] = None
+    estado: str  # insertado | actualizado | ignorado | error
+    detalle: Optional[str] = None
+
+class StockBulkResponse(BaseModel):
+    insertados: int
+    actualizados: int
+    errores: int
+    resultados: List[StockBulkResultado]
+
+class StockSnapshotResponse(BaseModel):
+    insertados: int
+    actualizados: int
+    puestos_en_cero: int
+    sin_cambios: int
+    dry_run: bool
+
 class DetalleRecetaCreate(BaseModel):
     id_medicamento: int
     cantidad_prescripta: int
@@ -126,6 +156,35 @@ class PedidoResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DetallePedidoResponse(BaseModel):
+    id_detalle: int
+    id_medicamento: int
+    cantidad: int
+    precio_unitario: float
+    
+    class Config:
+        from_attributes = True
+
+class FarmaciaResumen(BaseModel):
+    id_usuario: int
+    nombre_comercial: str
+    
+    class Config:
+        from_attributes = True
+
+class PedidoDetalleResponse(PedidoResponse):
+    # Historial de pedidos: con las líneas y el nombre de la farmacia
+    detalles: List[DetallePedidoResponse] = []
+    farmacia: Optional[FarmaciaResumen] = None
+
+class PedidoColaResponse(PedidoResponse):
+    detalles: List[DetallePedidoResponse] = []
+
+class ColaPedidosResponse(BaseModel):
+    # Cantidad de pedidos de la farmacia en cada estado + la página pedida
+    conteos: Dict[str, int]
+    pedidos: List[PedidoColaResponse]
+
 class LoginRequest(BaseModel):
     email: EmailStr
     contraseña: str
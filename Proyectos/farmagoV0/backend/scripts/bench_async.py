@@ -0,0 +1,88 @@
+"""Throughput of the hot read routes, sync engine vs. ASYNC_DB=true
+
+Levanta la API con uvicorn (una vez por valor de ASYNC_DB) sobre la base de
+benchmark y abre muchas conexiones concurrentes contra el inventario de una
+farmacia y la búsqueda de farmacias cercanas (ninguna de las dos pasa por la
+caché del catálogo). Informa pedidos por segundo y latencias.
+
+Uso:
+    python scripts/bench_async.py --concurrency 500 --seconds 15
+"""
+import sys
+import os
+import argparse
+import asyncio
+import itertools
+import subprocess
+import time
+
+import httpx
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, SCRIPT_DIR)
+
+from bench_utils import BENCH_DATABASE_URL, report
+from bench_login_mix import wait_until_up
+
+PATHS = [
+    "/api/pharmacies/inventory/1?limit=50",
+    "/api/pharmacies/inventory/2?limit=50&sort=price",
+    "/api/pharmacies/nearby?lat=-34.6037&lon=-58.3816&k=3",
+]
+
+async def load(base_url, concurrency, seconds):
+    samples, errors = [], [0]
+    paths = itertools.cycle(PATHS)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(next(paths))
+                    if response.status_code != 200:
+                        errors[0] += 1
+                except httpx.HTTPError:
+                    errors[0] += 1
+                samples.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, errors[0], elapsed
+
+def run_mode(async_db, args, env):
+    label = "async" if async_db == "true" else "sync"
+    base_url = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--log-level", "warning", "--backlog", str(max(2048, args.concurrency * 2))],
+        cwd=PARENT_DIR, env={**env, "ASYNC_DB": async_db}
+    )
+    try:
+        wait_until_up(base_url, proc)
+        samples, errors, elapsed = asyncio.run(load(base_url, args.concurrency, args.seconds))
+        report(f"[{label}] {args.concurrency} conexiones", samples)
+        print(f"[{label}] {len(samples) / elapsed:.1f} req/s, errores: {errors}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--modes", nargs="+", default=["false", "true"])
+    args = parser.parse_args()
+
+    env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "ENV": "production"}
+    subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "seed_db.py")], env=env, check=True)
+    for async_db in args.modes:
+        run_mode(async_db, args, env)
+
+if __name__ == "__main__":
+    main()
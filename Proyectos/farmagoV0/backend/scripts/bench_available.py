@@ -0,0 +1,132 @@
+"""Benchmark of the stock-aware search (GET /api/medications/search with lat/lon)
+
+Compara el query único (búsqueda ⨝ stock ⨝ farmacias del radio) con lo que
+hacía el front: buscar y después pedir la disponibilidad de cada resultado.
+
+Uso:
+    python scripts/bench_available.py --pharmacies 10000 --medications 2000 --stock 1000000
+"""
+import sys
+import os
+import argparse
+import random
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from fastapi import Response
+from sqlalchemy import insert, func
+from database import Base, create_missing_indexes
+from models import Farmacia, Medicamento, StockMedicamento
+from routes.medications import search_medications, get_pharmacies_with_medication
+from utils.search import setup_search, build_search_text, search_medications_query
+from utils.geo import setup_geo
+from bench_utils import bench_session_factory, report
+from bench_nearby import CIUDADES, populate as populate_pharmacies, timed
+
+PALABRAS = ["ibuprofeno", "paracetamol", "amoxicilina", "omeprazol", "loratadina", "metformina",
+            "atorvastatina", "losartan", "diclofenac", "cetirizina", "salbutamol", "enalapril"]
+CONSULTAS = ["ibu", "para", "amox", "ome", "lor", "met", "ator", "los", "dic", "ceti"]
+
+def populate_medications(Session, rows):
+    db = Session()
+    existing = db.query(func.count(Medicamento.id_medicamento)).scalar()
+    if existing < rows:
+        print(f"Generando {rows - existing} medicamentos...")
+        medicamentos = []
+        for i in range(existing, rows):
+            nombre = f"{PALABRAS[i % len(PALABRAS)].capitalize()} {100 + i}mg"
+            principio = PALABRAS[(i // len(PALABRAS)) % len(PALABRAS)]
+            medicamentos.append({
+                "nombre_comercial": nombre, "principio_activo": principio, "presentacion": "x",
+                "requiere_receta": False, "laboratorio": "Bench", "categoria": "Bench",
+                # El insert masivo no pasa por los eventos del ORM
+                "texto_busqueda": build_search_text(nombre, principio),
+            })
+        db.execute(insert(Medicamento.__table__), medicamentos)
+        db.commit()
+    db.close()
+
+def populate_stock(Session, rows):
+    db = Session()
+    existing = db.query(func.count(StockMedicamento.id_stock)).scalar()
+    if existing >= rows:
+        db.close()
+        return
+    farmacias = [id for (id,) in db.query(Farmacia.id_usuario)]
+    medicamentos = [id for (id,) in db.query(Medicamento.id_medicamento)]
+    per_pharmacy = max(1, min(len(medicamentos), rows // len(farmacias)))
+    print(f"Generando {rows - existing} filas de stock ({per_pharmacy} por farmacia)...")
+    rnd = random.Random(rows)
+    batch, total = [], existing
+    for id_farmacia in farmacias[existing // per_pharmacy:]:
+        for id_medicamento in rnd.sample(medicamentos, per_pharmacy):
+            batch.append({
+                "id_farmacia": id_farmacia, "id_medicamento": id_medicamento,
+                "precio": round(rnd.uniform(100, 5000), 2),
+                # Un 20% sin stock
+                "cantidad_disponible": 0 if rnd.random() < 0.2 else rnd.randint(1, 200),
+            })
+        if len(batch) >= 20000:
+            db.execute(insert(StockMedicamento.__table__), batch)
+            db.commit()
+            total += len(batch)
+            batch = []
+        if total >= rows:
+            break
+    if batch:
+        db.execute(insert(StockMedicamento.__table__), batch)
+        db.commit()
+    db.close()
+
+def search(db, query, lat, lon, radius_km):
+    return search_medications(None, Response(), query=query, categoria=None, requiere_receta=None,
+                              lat=lat, lon=lon, radius_km=radius_km, limit=20, cursor=None, db=db)
+
+def search_then_check(db, query, lat, lon, radius_km):
+    # Antes: búsqueda sin stock + una consulta de disponibilidad por resultado
+    found = search_medications_query(db, query).limit(20).all()
+    return [
+        get_pharmacies_with_medication(m.id_medicamento, Response(), lat=lat, lon=lon, max_km=radius_km,
+                                       sort="distance", limit=1, cursor=None, db=db)
+        for m in found
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pharmacies", type=int, default=10_000)
+    parser.add_argument("--medications", type=int, default=2_000)
+    parser.add_argument("--stock", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    engine, Session = bench_session_factory()
+    Base.metadata.create_all(bind=engine)
+    setup_search(engine)
+    setup_geo(engine)
+    create_missing_indexes(engine)
+    populate_pharmacies(Session, args.pharmacies)
+    populate_medications(Session, args.medications)
+    populate_stock(Session, args.stock)
+
+    db = Session()
+    total = db.query(func.count(StockMedicamento.id_stock)).scalar()
+    print(f"\n--- {total} filas de stock, {args.pharmacies} farmacias ({engine.dialect.name}) ---")
+    rnd = random.Random(11)
+    casos = [
+        (rnd.choice(CONSULTAS), rnd.gauss(lat, s), rnd.gauss(lon, s))
+        for lat, lon, s in CIUDADES for _ in range(4)
+    ]
+    for radius_km in (2, 5):
+        caso = iter(casos * args.iterations)
+        report(f"radio {radius_km} km (query único)", timed(lambda: search(db, *next(caso), radius_km), args.iterations))
+        caso = iter(casos * args.iterations)
+        report(f"radio {radius_km} km (búsqueda + 1 por resultado)",
+               timed(lambda: search_then_check(db, *next(caso), radius_km), max(3, args.iterations // 3)))
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Catalog latency under a login burst, bcrypt inline vs. process pool
+
+Levanta la API con uvicorn (una vez por modo de PASSWORD_HASH_POOL) sobre la
+base de benchmark, manda logins desde varios hilos y mide la latencia de
+GET /api/medications/ al mismo tiempo.
+
+Uso:
+    python scripts/bench_login_mix.py --login-threads 16 --seconds 10
+"""
+import sys
+import os
+import argparse
+import json
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, SCRIPT_DIR)
+
+from bench_utils import BENCH_DATABASE_URL, report
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def wait_until_up(base_url, proc):
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn terminó antes de arrancar")
+        try:
+            if request(f"{base_url}/health") == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("uvicorn no respondió")
+
+def measure_catalog(base_url, seconds):
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        request(f"{base_url}/api/medications/?limit=50")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def run_mode(mode, args, env):
+    port = args.port
+    base_url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PARENT_DIR, env={**env, "PASSWORD_HASH_POOL": mode}
+    )
+    try:
+        wait_until_up(base_url, proc)
+        report(f"[{mode}] catálogo sin logins", measure_catalog(base_url, args.seconds / 2))
+
+        stop = threading.Event()
+        logins = [0]
+        def login_loop():
+            while not stop.is_set():
+                request(f"{base_url}/api/auth/login", {"email": "cliente@test.com", "password": "password123"})
+                logins[0] += 1
+        hilos = [threading.Thread(target=login_loop) for _ in range(args.login_threads)]
+        for hilo in hilos:
+            hilo.start()
+        samples = measure_catalog(base_url, args.seconds)
+        stop.set()
+        for hilo in hilos:
+            hilo.join()
+        report(f"[{mode}] catálogo con {args.login_threads} hilos de login", samples)
+        print(f"[{mode}] logins: {logins[0] / args.seconds:.1f}/s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--modes", nargs="+", default=["inline", "process"])
+    args = parser.parse_args()
+
+    env = {
+        **os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "ENV": "production",
+        # Acá se quiere medir bcrypt, no el rate limit de login
+        "LOGIN_IP_CAPACITY": "1000000", "LOGIN_IP_PER_MINUTE": "1000000",
+        "LOGIN_EMAIL_CAPACITY": "1000000", "LOGIN_EMAIL_PER_MINUTE": "1000000",
+    }
+    subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "seed_db.py")], env=env, check=True)
+    for mode in args.modes:
+        run_mode(mode, args, env)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Overhead of /metrics instrumentation (middleware + SQL hooks)
+
+Corre la app en el mismo proceso (ASGI, sin red: el ruido de red taparía unos
+pocos microsegundos) una vez con METRICS_ENABLED=false y otra con true, y mide
+la latencia de una ruta sin base (/health) y de dos que hacen queries. Como la
+diferencia suele quedar dentro del ruido entre corridas, también mide aparte el
+costo de los hooks por query y de registrar un request.
+
+Uso:
+    python scripts/bench_metrics.py --requests 3000
+"""
+import sys
+import os
+import argparse
+import asyncio
+import subprocess
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, SCRIPT_DIR)
+
+from bench_utils import BENCH_DATABASE_URL, report
+
+PATHS = ["/health", "/api/pharmacies/inventory/1?limit=50", "/api/medications/search?query=ibu&lat=-34.6037&lon=-58.3816"]
+
+async def measure(app, path, requests):
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(min(200, requests)):
+            await client.get(path)
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get(path)
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path}: {response.status_code}")
+    return samples
+
+def measure_hooks(queries):
+    """Per-query cost of the SQL hooks and per-request cost of the histograms"""
+    sys.path.insert(0, PARENT_DIR)
+    from sqlalchemy import create_engine, text
+    from utils.metrics import install_db_hooks, request_duration, request_queries, request_db_time
+
+    def select_loop():
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(queries):
+                conn.execute(text("SELECT 1"))
+            return (time.perf_counter() - start) / queries * 1e6
+
+    without_hooks = select_loop()
+    install_db_hooks()
+    with_hooks = select_loop()
+    print(f"SELECT 1: {without_hooks:.2f}us sin hooks, {with_hooks:.2f}us con hooks ({with_hooks - without_hooks:+.2f}us por query)")
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        request_duration.observe(("GET", "/bench", 200), 0.003)
+        request_queries.observe(("GET", "/bench"), 2)
+        request_db_time.observe(("GET", "/bench"), 0.0004)
+    print(f"registrar un request: {(time.perf_counter() - start) / queries * 1e6:.2f}us")
+
+def run_child(args):
+    sys.path.insert(0, PARENT_DIR)
+    os.chdir(PARENT_DIR)
+    import main
+    label = "con métricas" if main.METRICS_ENABLED else "sin métricas"
+    for path in PATHS:
+        report(f"[{label}] {path.split('?')[0]}", asyncio.run(measure(main.app, path, args.requests)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "ENV": "production"}
+    subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "seed_db.py")], env=env, check=True)
+    for enabled in ("false", "true"):
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(args.requests)],
+            env={**env, "METRICS_ENABLED": enabled}, check=True
+        )
+    measure_hooks(args.requests * 20)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark of /api/pharmacies/nearby (grid index) against a full Python scan
+
+Uso:
+    python scripts/bench_nearby.py --sizes 10000 100000
+"""
+import sys
+import os
+import argparse
+import math
+import random
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from sqlalchemy import insert, func
+from database import Base, create_missing_indexes
+from models import Usuario, Farmacia
+from routes.pharmacies import get_nearby_pharmacies
+from utils.geo import setup_geo, cell_key, KM_PER_DEGREE
+from bench_utils import bench_session_factory, report
+
+# (lat, lon, dispersión en grados) de algunas ciudades
+CIUDADES = [
+    (-34.60, -58.38, 0.15), (-34.92, -57.95, 0.05), (-31.42, -64.18, 0.08), (-32.95, -60.65, 0.07),
+    (-32.89, -68.83, 0.06), (-26.82, -65.22, 0.05), (-38.00, -57.55, 0.05), (-24.78, -65.41, 0.04),
+]
+
+def populate(Session, rows):
+    db = Session()
+    existing = db.query(func.count(Farmacia.id_usuario)).scalar()
+    if existing >= rows:
+        db.close()
+        return
+    print(f"Generando {rows - existing} farmacias...")
+    rnd = random.Random(rows)
+    next_id = (db.query(func.max(Usuario.id_usuario)).scalar() or 0) + 1
+    usuarios, farmacias = [], []
+    for i in range(existing, rows):
+        lat0, lon0, spread = rnd.choice(CIUDADES)
+        lat, lon = rnd.gauss(lat0, spread), rnd.gauss(lon0, spread)
+        usuarios.append({
+            "id_usuario": next_id, "nombre": "Farmacia", "apellido": f"Bench {i}",
+            "email": f"bench{i}@farmago.test", "contraseña": "x", "tipo_usuario": "farmacia",
+        })
+        farmacias.append({
+            "id_usuario": next_id, "nombre_comercial": f"Farmacia Bench {i}", "cuit": f"bench-{i}",
+            "latitud": lat, "longitud": lon,
+            # El insert masivo no pasa por los eventos del ORM
+            "celda_geo": cell_key(lat, lon),
+        })
+        next_id += 1
+        if len(usuarios) == 5000:
+            db.execute(insert(Usuario.__table__), usuarios)
+            db.execute(insert(Farmacia.__table__), farmacias)
+            db.commit()
+            usuarios, farmacias = [], []
+    if usuarios:
+        db.execute(insert(Usuario.__table__), usuarios)
+        db.execute(insert(Farmacia.__table__), farmacias)
+        db.commit()
+    db.close()
+
+def full_scan(db, lat, lon, k):
+    # Lo que habría que hacer sin índice: traer todas y ordenar en Python
+    rows = db.query(Farmacia.id_usuario, Farmacia.latitud, Farmacia.longitud).filter(Farmacia.latitud.isnot(None)).all()
+    scale = math.cos(math.radians(lat))
+    return sorted(
+        rows,
+        key=lambda r: ((r.latitud - lat) * KM_PER_DEGREE) ** 2 + ((r.longitud - lon) * KM_PER_DEGREE * scale) ** 2
+    )[:k]
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    engine, Session = bench_session_factory()
+    Base.metadata.create_all(bind=engine)
+    setup_geo(engine)
+    create_missing_indexes(engine)
+    rnd = random.Random(7)
+
+    for size in sorted(args.sizes):
+        populate(Session, size)
+        db = Session()
+        puntos = [(rnd.gauss(lat, s), rnd.gauss(lon, s)) for lat, lon, s in CIUDADES for _ in range(3)]
+        print(f"\n--- {size} farmacias ({engine.dialect.name}) ---")
+        point = iter(puntos * args.iterations)
+        report("k=10 (grilla)", timed(lambda: get_nearby_pharmacies(*next(point), k=10, radius_km=None, db=db), args.iterations))
+        point = iter(puntos * args.iterations)
+        report("radio 3 km, k=50 (grilla)", timed(lambda: get_nearby_pharmacies(*next(point), k=50, radius_km=3, db=db), args.iterations))
+        point = iter(puntos * args.iterations)
+        report("k=10 (scan completo en Python)", timed(lambda: full_scan(db, *next(point), 10), max(3, args.iterations // 5)))
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark of /api/medications/search over a large synthetic catalog
+
+Uso:
+    BENCH_DATABASE_URL=postgresql://.../bench python scripts/bench_search.py --rows 100000
+"""
+import sys
+import os
+import argparse
+import random
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from sqlalchemy import insert, func
+from database import Base
+from models import Medicamento
+from utils.search import setup_search, search_medications_query, build_search_text
+from bench_utils import bench_session_factory, report
+
+PRINCIPIOS = [
+    "Ibuprofeno", "Paracetamol", "Amoxicilina", "Omeprazol", "Loratadina", "Atorvastatina",
+    "Ácido Ascórbico", "Ácido Acetilsalicílico", "Metformina", "Losartán", "Enalapril",
+    "Diclofenac", "Clonazepam", "Levotiroxina", "Salbutamol", "Cetirizina", "Ranitidina",
+    "Azitromicina", "Cefalexina", "Dexametasona", "Prednisona", "Simvastatina", "Insulina",
+]
+MARCAS = ["Actron", "Tafirol", "Amoxidal", "Ultop", "Alergial", "Lipitor", "Redoxon", "Bayaspirina",
+          "Glucophage", "Cozaar", "Lotrial", "Voltaren", "Rivotril", "Eutirox", "Ventolin", "Zyrtec"]
+LABS = ["Gador", "Bayer", "Roemmers", "Bagó", "Elea", "Casasco", "Raffo", "Montpellier"]
+CATEGORIAS = ["Analgésicos", "Antibióticos", "Digestivos", "Antihistamínicos", "Cardiovascular"]
+CONSULTAS = ["ibu", "paracetamol", "acido", "ÁCIDO ASC", "amox 500", "omepra", "losartan",
+             "diclo", "insulina", "zyrtec", "vitamina", "clonaz", "xyz"]
+
+def populate(Session, rows):
+    db = Session()
+    existing = db.query(func.count(Medicamento.id_medicamento)).scalar()
+    if existing >= rows:
+        print(f"La base ya tiene {existing} medicamentos")
+        db.close()
+        return
+    print(f"Generando {rows - existing} medicamentos...")
+    rnd = random.Random(42)
+    batch = []
+    for i in range(existing, rows):
+        principio = rnd.choice(PRINCIPIOS)
+        nombre = f"{rnd.choice(MARCAS)} {principio.split()[0]} {rnd.choice([5, 10, 20, 40, 100, 250, 400, 500, 850, 1000])}mg #{i}"
+        batch.append({
+            "nombre_comercial": nombre,
+            "principio_activo": principio,
+            "presentacion": f"{rnd.choice([10, 20, 30, 60])} comprimidos",
+            "requiere_receta": rnd.random() < 0.3,
+            "laboratorio": rnd.choice(LABS),
+            "categoria": rnd.choice(CATEGORIAS),
+            # El insert masivo no pasa por los eventos del ORM
+            "texto_busqueda": build_search_text(nombre, principio),
+        })
+        if len(batch) == 5000:
+            db.execute(insert(Medicamento), batch)
+            db.commit()
+            batch = []
+    if batch:
+        db.execute(insert(Medicamento), batch)
+        db.commit()
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    engine, Session = bench_session_factory()
+    Base.metadata.create_all(bind=engine)
+    populate(Session, args.rows)
+    setup_search(engine)
+
+    import utils.search
+    print(f"Motor: {engine.dialect.name} / índice: {utils.search._backend}")
+
+    db = Session()
+    todas = []
+    for consulta in CONSULTAS:
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            query = search_medications_query(db, consulta)
+            if query is not None:
+                query.limit(args.limit).all()
+            samples.append((time.perf_counter() - start) * 1000)
+        report(f"'{consulta}'", samples)
+        todas.extend(samples)
+    report("TOTAL", todas)
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark of inventory snapshot reconciliation (PUT /api/pharmacies/stock/snapshot)
+
+Mide cuánto cuesta reenviar un snapshot completo sin cambios, con un 1% de
+cambios y comparado con reescribir todo con el upsert masivo.
+
+Uso:
+    python scripts/bench_snapshot.py --rows 20000
+"""
+import sys
+import os
+import argparse
+import random
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from sqlalchemy import event, insert, func
+from database import Base, create_missing_indexes
+from models import Farmacia, Medicamento
+from schemas import StockMedicamentoCreate
+from utils.inventory import reconcile_snapshot, upsert_stock
+from bench_utils import bench_session_factory
+
+BENCH_FARMACIA_EMAIL = "snapshot@farmago.test"
+
+def populate(Session, rows):
+    db = Session()
+    existing = db.query(func.count(Medicamento.id_medicamento)).scalar()
+    if existing < rows:
+        print(f"Generando {rows - existing} medicamentos...")
+        db.execute(insert(Medicamento.__table__), [
+            {
+                "nombre_comercial": f"Medicamento Bench {i}", "principio_activo": "bench", "presentacion": "x",
+                "requiere_receta": False, "laboratorio": "Bench", "categoria": "Bench",
+            }
+            for i in range(existing, rows)
+        ])
+    farmacia = db.query(Farmacia).filter(Farmacia.email == BENCH_FARMACIA_EMAIL).first()
+    if not farmacia:
+        farmacia = Farmacia(nombre="Farmacia", apellido="Snapshot", email=BENCH_FARMACIA_EMAIL, contraseña="x",
+                            nombre_comercial="Farmacia Snapshot", cuit="bench-snapshot")
+        db.add(farmacia)
+    db.commit()
+    ids = [id for (id,) in db.query(Medicamento.id_medicamento).order_by(Medicamento.id_medicamento).limit(rows)]
+    id_farmacia = farmacia.id_usuario
+    db.close()
+    return id_farmacia, ids
+
+def count_writes(engine):
+    counter = {"writes": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            counter["writes"] += len(parameters) if executemany else 1
+    return counter
+
+def run(label, Session, counter, fn):
+    db = Session()
+    counter["writes"] = 0
+    start = time.perf_counter()
+    result = fn(db)
+    elapsed = (time.perf_counter() - start) * 1000
+    db.close()
+    print(f"{label:<40} {elapsed:9.1f}ms  sentencias de escritura={counter['writes']:<5} {result or ''}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    engine, Session = bench_session_factory()
+    Base.metadata.create_all(bind=engine)
+    create_missing_indexes(engine)
+    id_farmacia, ids = populate(Session, args.rows)
+    counter = count_writes(engine)
+
+    rnd = random.Random(3)
+    snapshot = {id: (round(rnd.uniform(100, 5000), 2), rnd.randint(0, 200)) for id in ids}
+
+    def as_valid(snap):
+        return {
+            id: (fila, StockMedicamentoCreate(id_medicamento=id, precio=precio, cantidad_disponible=cantidad))
+            for fila, (id, (precio, cantidad)) in enumerate(snap.items(), start=1)
+        }
+
+    def upsert_all(snap):
+        def fn(db):
+            upsert_stock(db, [
+                {"id_farmacia": id_farmacia, "id_medicamento": id, "precio": precio, "cantidad_disponible": cantidad}
+                for id, (precio, cantidad) in snap.items()
+            ])
+            db.commit()
+        return fn
+
+    print(f"--- snapshot de {len(ids)} filas ({engine.dialect.name}) ---")
+    run("primer snapshot (todo nuevo)", Session, counter, lambda db: reconcile_snapshot(db, id_farmacia, as_valid(snapshot)))
+    run("mismo snapshot (reconciliación)", Session, counter, lambda db: reconcile_snapshot(db, id_farmacia, as_valid(snapshot)))
+    run("mismo snapshot (upsert de todo)", Session, counter, upsert_all(snapshot))
+
+    changed = dict(snapshot)
+    for id in rnd.sample(ids, max(1, len(ids) // 100)):
+        changed[id] = (changed[id][0], changed[id][1] + 1)
+    for id in rnd.sample(ids, max(1, len(ids) // 200)):
+        changed.pop(id)
+    run("1% cambios + 0.5% quitados", Session, counter, lambda db: reconcile_snapshot(db, id_farmacia, as_valid(changed)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import statistics
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Los benchmarks llenan la base con datos sintéticos: por defecto usan un
+# SQLite aparte para no tocar la base de desarrollo.
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "sqlite:///bench.db")
+
+def bench_session_factory(url: str = BENCH_DATABASE_URL):
+    """Engine + sessionmaker for the benchmark database"""
+    engine = create_engine(url)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def report(label, samples_ms):
+    """Print p50/p95/p99 for a list of latencies in milliseconds"""
+    print(
+        f"{label:<40} n={len(samples_ms):<6} "
+        f"p50={percentile(samples_ms, 50):8.2f}ms "
+        f"p95={percentile(samples_ms, 95):8.2f}ms "
+        f"p99={percentile(samples_ms, 99):8.2f}ms "
+        f"media={statistics.fmean(samples_ms) if samples_ms else 0:8.2f}ms"
+    )
@@ -0,0 +1,62 @@
+"""Merge duplicate (farmacia, medicamento) stock rows and create the unique index
+
+Antes del índice uq_stock_farmacia_medicamento podía haber varias filas de
+stock para el mismo par. Por cada par se queda la fila más nueva (mayor
+id_stock) con su precio y la suma de las cantidades; las demás se borran y se
+listan. Todo va en una transacción junto con la creación del índice, así no
+aparecen duplicados nuevos en el medio. La app no arranca hasta que se corre.
+
+Uso:
+    python scripts/merge_duplicate_stock.py --dry-run
+    python scripts/merge_duplicate_stock.py
+"""
+import sys
+import os
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+
+from sqlalchemy import delete, select, update
+from database import engine
+from models import StockMedicamento
+from utils.inventory import STOCK_UNIQUE_INDEX, duplicate_stock_pairs
+
+def merge_pair(conn, id_farmacia: int, id_medicamento: int, dry_run: bool):
+    rows = conn.execute(
+        select(StockMedicamento.id_stock, StockMedicamento.precio, StockMedicamento.cantidad_disponible)
+        .where(StockMedicamento.id_farmacia == id_farmacia, StockMedicamento.id_medicamento == id_medicamento)
+        .order_by(StockMedicamento.id_stock)
+        .with_for_update()
+    ).all()
+    *removed, kept = rows
+    total = sum(row.cantidad_disponible for row in rows)
+    print(f"farmacia {id_farmacia}, medicamento {id_medicamento}: queda id_stock {kept.id_stock} "
+          f"(precio {kept.precio}, cantidad {kept.cantidad_disponible} -> {total})")
+    for row in removed:
+        print(f"  se borra id_stock {row.id_stock} (precio {row.precio}, cantidad {row.cantidad_disponible})")
+    if dry_run:
+        return
+    conn.execute(
+        update(StockMedicamento).where(StockMedicamento.id_stock == kept.id_stock)
+        .values(cantidad_disponible=total)
+    )
+    conn.execute(delete(StockMedicamento).where(StockMedicamento.id_stock.in_([row.id_stock for row in removed])))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="solo listar lo que se uniría")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        pairs = duplicate_stock_pairs(conn)
+        for id_farmacia, id_medicamento, _ in pairs:
+            merge_pair(conn, id_farmacia, id_medicamento, args.dry_run)
+        if not args.dry_run:
+            index = next(i for i in StockMedicamento.__table__.indexes if i.name == STOCK_UNIQUE_INDEX)
+            index.create(bind=conn, checkfirst=True)
+    print(f"{len(pairs)} pares duplicados" + (" (dry run, sin cambios)" if args.dry_run else " unidos"))
+
+if __name__ == "__main__":
+    main()
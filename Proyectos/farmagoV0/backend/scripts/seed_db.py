@@ -14,10 +14,16 @@ from database import SessionLocal, engine, Base
 from models import Usuario, Cliente, Farmacia, Medicamento, StockMedicamento
 from models import Direccion, MetodoDePago
 from utils.security import hash_password
+from utils.search import setup_search
+from utils.geo import setup_geo
+from utils.changes import setup_changes
 
 def seed_database():
     # Create tables
     Base.metadata.create_all(bind=engine)
+    setup_search(engine)
+    setup_geo(engine)
+    setup_changes(engine)
     
     db = SessionLocal()
     
@@ -0,0 +1,126 @@
+"""Concurrent checkout stress test for POST /api/orders/
+
+Varios hilos compran el mismo medicamento en la misma farmacia al mismo
+tiempo. Al final se verifica que no se vendió más de lo que había:
+    stock_inicial - stock_final == unidades vendidas  y  stock_final >= 0
+
+Uso:
+    BENCH_DATABASE_URL=postgresql://.../bench python scripts/stress_orders.py --threads 16 --orders 200
+"""
+import sys
+import os
+import argparse
+import random
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.join(SCRIPT_DIR, '..')
+sys.path.insert(0, PARENT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from database import Base
+from models import Cliente, Farmacia, Medicamento, StockMedicamento, DetallePedido
+from schemas import PedidoCreate, DetallePedidoCreate
+from routes.orders import _create_order
+from bench_utils import bench_session_factory
+
+def setup(Session, threads, stock_inicial):
+    db = Session()
+    tag = str(int(time.time() * 1000))
+    farmacia = Farmacia(
+        nombre="Farmacia", apellido="Stress", email=f"stress-farmacia-{tag}@farmago.test", contraseña="x",
+        nombre_comercial="Farmacia Stress", cuit=f"stress-{tag}"
+    )
+    medicamento = Medicamento(
+        nombre_comercial=f"Stressina {tag}", principio_activo="Stressina", presentacion="10 comprimidos",
+        laboratorio="Bench", categoria="Bench"
+    )
+    clientes = [
+        Cliente(nombre="Cliente", apellido=f"Stress {i}", email=f"stress-{tag}-{i}@farmago.test",
+                contraseña="x", dni=f"stress-{tag}-{i}")
+        for i in range(threads)
+    ]
+    db.add_all([farmacia, medicamento, *clientes])
+    db.flush()
+    db.add(StockMedicamento(
+        id_farmacia=farmacia.id_usuario, id_medicamento=medicamento.id_medicamento,
+        precio=100.0, cantidad_disponible=stock_inicial
+    ))
+    db.commit()
+    ids = farmacia.id_usuario, medicamento.id_medicamento, [c.id_usuario for c in clientes]
+    db.close()
+    return ids
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--orders", type=int, default=100, help="pedidos por hilo")
+    parser.add_argument("--stock", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine, Session = bench_session_factory()
+    Base.metadata.create_all(bind=engine)
+    id_farmacia, id_medicamento, id_clientes = setup(Session, args.threads, args.stock)
+
+    lock = threading.Lock()
+    totales = {"ok": 0, "sin_stock": 0, "errores": 0, "unidades": 0}
+
+    def comprar(id_cliente, seed):
+        rnd = random.Random(seed)
+        for _ in range(args.orders):
+            cantidad = rnd.randint(1, 3)
+            pedido = PedidoCreate(
+                id_farmacia=id_farmacia, metodo_pago="stress",
+                detalles=[DetallePedidoCreate(id_medicamento=id_medicamento, cantidad=cantidad)]
+            )
+            db = Session()
+            try:
+                cliente = db.get(Cliente, id_cliente)
+                _create_order(pedido, cliente, db)
+                resultado = "ok"
+            except HTTPException:
+                resultado = "sin_stock"
+            except Exception:
+                db.rollback()
+                resultado = "errores"
+            finally:
+                db.close()
+            with lock:
+                totales[resultado] += 1
+                if resultado == "ok":
+                    totales["unidades"] += cantidad
+
+    hilos = [threading.Thread(target=comprar, args=(id_cliente, i)) for i, id_cliente in enumerate(id_clientes)]
+    start = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    elapsed = time.perf_counter() - start
+
+    db = Session()
+    stock_final = db.query(StockMedicamento.cantidad_disponible).filter(
+        StockMedicamento.id_farmacia == id_farmacia,
+        StockMedicamento.id_medicamento == id_medicamento
+    ).scalar()
+    vendidas = db.query(func.coalesce(func.sum(DetallePedido.cantidad), 0)).filter(
+        DetallePedido.id_medicamento == id_medicamento
+    ).scalar()
+    db.close()
+
+    intentos = args.threads * args.orders
+    print(f"Motor: {engine.dialect.name} | {args.threads} hilos x {args.orders} pedidos")
+    print(f"Pedidos OK: {totales['ok']} | sin stock: {totales['sin_stock']} | errores: {totales['errores']}")
+    print(f"Throughput: {intentos / elapsed:.1f} pedidos/s ({totales['ok'] / elapsed:.1f} confirmados/s)")
+    print(f"Stock inicial: {args.stock} | final: {stock_final} | vendidas (detalles): {vendidas} | vendidas (hilos): {totales['unidades']}")
+
+    if stock_final < 0 or args.stock - stock_final != vendidas or vendidas != totales["unidades"]:
+        print("FALLA: sobreventa o stock inconsistente")
+        sys.exit(1)
+    print("OK: sin sobreventa")
+
+if __name__ == "__main__":
+    main()
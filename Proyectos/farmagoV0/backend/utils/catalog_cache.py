@@ -0,0 +1,116 @@
+import os
+import threading
+import uuid
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from utils.cache import TTLCache, make_etag, etag_matches
+from utils.replicas import replica_router
+
+# Caché del catálogo de medicamentos (detalle, listado y búsqueda sin lat/lon)
+# ya serializado, con su ETag. Las claves llevan la versión del catálogo:
+# create_medication la incrementa y lo que se calculó antes deja de leerse,
+# aunque termine de guardarse después del cambio.
+#
+# El ETag es el hash del cuerpo: un 304 evita la base solo si la respuesta ya
+# está en la caché. La versión es de cada proceso y no sirve como ETag (dos
+# workers pueden tener la misma versión con datos distintos).
+#
+# El aviso a los demás workers es intercambiable (CATALOG_NOTIFIER):
+#   - "broker": por el EventBroker (con EVENTS_BACKEND=postgres llega a todos)
+#   - "none": solo este proceso
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "2000"))
+CATALOG_NOTIFIER = os.getenv("CATALOG_NOTIFIER", "broker")
+CATALOG_CHANNEL = "catalogo"
+
+class NullNotifier:
+    """Version bumps stay in this process"""
+
+    def bind(self, on_remote_bump):
+        pass
+
+    def publish(self):
+        pass
+
+class BrokerNotifier:
+    """Version bumps travel to the other workers through the EventBroker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.origin = uuid.uuid4().hex
+
+    def bind(self, on_remote_bump):
+        def _listener(event):
+            # El backend "memory" nos devuelve nuestro propio aviso
+            if event.get("origen") != self.origin:
+                on_remote_bump()
+        self.broker.add_listener(CATALOG_CHANNEL, _listener)
+
+    def publish(self):
+        self.broker.publish([CATALOG_CHANNEL], "version_catalogo", {"origen": self.origin})
+
+class CatalogCache:
+    """Versioned LRU + TTL cache of catalog responses"""
+
+    def __init__(self, notifier, maxsize: int = CATALOG_CACHE_SIZE, ttl: float = CATALOG_CACHE_TTL_SECONDS):
+        self.version = 0
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.notifier = notifier
+        self.notifier.bind(self._invalidate)
+
+    def _invalidate(self):
+        with self._lock:
+            self.version += 1
+        self._entries.clear()
+        # Un rato todo al primario: una réplica atrasada llenaría la caché con el catálogo viejo
+        replica_router.pin_primary()
+
+    def bump(self):
+        """Call after committing a catalog change"""
+        self._invalidate()
+        self.notifier.publish()
+
+    def respond(self, request: Request, key: tuple, compute):
+        """Serve key from the cache (or compute() -> (body, headers)), answering 304 when the ETag matches"""
+        version = self.version
+        entry = self._entries.get((version, *key))
+        if entry is None:
+            entry = self._store(version, key, *compute())
+        return self._response(request, entry)
+
+    async def respond_async(self, request: Request, key: tuple, compute):
+        """Same as respond() for an async compute()"""
+        version = self.version
+        entry = self._entries.get((version, *key))
+        if entry is None:
+            entry = self._store(version, key, *(await compute()))
+        return self._response(request, entry)
+
+    def _store(self, version: int, key: tuple, body, headers: dict):
+        entry = (make_etag(body), body, headers)
+        self._entries.set((version, *key), entry)
+        return entry
+
+    def _response(self, request: Request, entry):
+        etag, body, headers = entry
+        headers = {**headers, "ETag": etag, "Cache-Control": "public, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(body, headers=headers)
+
+    @property
+    def hits(self):
+        return self._entries.hits
+
+    @property
+    def misses(self):
+        return self._entries.misses
+
+def _build_notifier():
+    if CATALOG_NOTIFIER == "broker":
+        from utils.events import broker
+        return BrokerNotifier(broker)
+    return NullNotifier()
+
+catalog_cache = CatalogCache(_build_notifier())
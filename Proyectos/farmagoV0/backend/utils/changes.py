@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from sqlalchemy import delete, insert, select, text, update
+from database import SessionLocal
+from models import Cambio, RecorteCambios
+
+# Diario de cambios (tabla `cambios`) para sincronizar catálogo y stock por
+# deltas. Lo llenan triggers de la base, así queda en la misma transacción que
+# el cambio sin importar por dónde se escribió (ORM, upsert masivo, checkout).
+#
+# En PostgreSQL un `seq` más bajo puede confirmarse después que uno más alto.
+# Los triggers toman un advisory lock compartido y los lectores lo intentan
+# tomar exclusivo sin esperar (pg_try_advisory_xact_lock, así no frenan a las
+# escrituras): si lo obtienen, todo `seq` ya asignado está confirmado (o
+# descartado) y ese es el límite seguro para leer. Si no, usan el último
+# límite seguro que obtuvo el proceso: el feed se atrasa un poco, pero nunca
+# saltea un cambio.
+CHANGES_LOCK_KEY = 4_180_018
+SAFE_BOUND_TRIES = 3
+SAFE_BOUND_RETRY_SECONDS = 0.01
+
+# Las entradas más viejas que CHANGES_RETENTION_DAYS se borran cada
+# CHANGES_TRIM_SECONDS y el seq más alto borrado queda en cambios_recorte; un
+# cliente con un `since` anterior recibe 410 y vuelve a sincronizar desde cero.
+# (No alcanza con MIN(seq): en PostgreSQL la secuencia saltea los valores de
+# las transacciones que se deshicieron.) Con 0 no se recorta.
+CHANGES_RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "30"))
+CHANGES_TRIM_SECONDS = float(os.getenv("CHANGES_TRIM_SECONDS", "3600"))
+
+# Solo cuenta como cambio de un medicamento lo que ve el cliente (no texto_busqueda)
+_MEDICAMENTO_FIELDS = ["nombre_comercial", "principio_activo", "presentacion", "requiere_receta", "laboratorio", "categoria"]
+# Un upsert que no cambia precio ni cantidad no genera entrada
+_STOCK_FIELDS = ["precio", "cantidad_disponible"]
+
+def _changed(fields, distinct: str) -> str:
+    return " OR ".join(f"old.{f} {distinct} new.{f}" for f in fields)
+
+_SQLITE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS cambios_stock_ai AFTER INSERT ON stock_medicamentos BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_farmacia, id_medicamento)
+        VALUES ('stock', 'insert', new.id_stock, new.id_farmacia, new.id_medicamento);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cambios_stock_au AFTER UPDATE ON stock_medicamentos
+    WHEN {_changed(_STOCK_FIELDS, "IS NOT")} BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_farmacia, id_medicamento)
+        VALUES ('stock', 'update', new.id_stock, new.id_farmacia, new.id_medicamento);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cambios_stock_ad AFTER DELETE ON stock_medicamentos BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_farmacia, id_medicamento)
+        VALUES ('stock', 'delete', old.id_stock, old.id_farmacia, old.id_medicamento);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cambios_medicamento_ai AFTER INSERT ON medicamentos BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_medicamento)
+        VALUES ('medicamento', 'insert', new.id_medicamento, new.id_medicamento);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cambios_medicamento_au AFTER UPDATE ON medicamentos
+    WHEN {_changed(_MEDICAMENTO_FIELDS, "IS NOT")} BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_medicamento)
+        VALUES ('medicamento', 'update', new.id_medicamento, new.id_medicamento);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cambios_medicamento_ad AFTER DELETE ON medicamentos BEGIN
+        INSERT INTO cambios (tabla, operacion, id_registro, id_medicamento)
+        VALUES ('medicamento', 'delete', old.id_medicamento, old.id_medicamento);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION registrar_cambio() RETURNS trigger AS $$
+    DECLARE
+        fila RECORD;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN fila := OLD; ELSE fila := NEW; END IF;
+        IF TG_TABLE_NAME = 'stock_medicamentos' THEN
+            IF TG_OP = 'UPDATE' AND NOT ({_changed(_STOCK_FIELDS, "IS DISTINCT FROM")}) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_advisory_xact_lock_shared({CHANGES_LOCK_KEY});
+            INSERT INTO cambios (tabla, operacion, id_registro, id_farmacia, id_medicamento)
+            VALUES ('stock', lower(TG_OP), fila.id_stock, fila.id_farmacia, fila.id_medicamento);
+        ELSE
+            IF TG_OP = 'UPDATE' AND NOT ({_changed(_MEDICAMENTO_FIELDS, "IS DISTINCT FROM")}) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_advisory_xact_lock_shared({CHANGES_LOCK_KEY});
+            INSERT INTO cambios (tabla, operacion, id_registro, id_medicamento)
+            VALUES ('medicamento', lower(TG_OP), fila.id_medicamento, fila.id_medicamento);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS cambios_stock ON stock_medicamentos",
+    "CREATE TRIGGER cambios_stock AFTER INSERT OR UPDATE OR DELETE ON stock_medicamentos "
+    "FOR EACH ROW EXECUTE PROCEDURE registrar_cambio()",
+    "DROP TRIGGER IF EXISTS cambios_medicamento ON medicamentos",
+    "CREATE TRIGGER cambios_medicamento AFTER INSERT OR UPDATE OR DELETE ON medicamentos "
+    "FOR EACH ROW EXECUTE PROCEDURE registrar_cambio()",
+]
+
+def setup_changes(engine):
+    """Install the triggers that fill the change journal"""
+    with engine.begin() as conn:
+        if conn.execute(select(RecorteCambios.id)).first() is None:
+            conn.execute(insert(RecorteCambios).values(id=1, hasta_seq=0))
+    if engine.dialect.name == "postgresql":
+        statements = _POSTGRES_DDL
+    elif engine.dialect.name == "sqlite":
+        statements = _SQLITE_DDL
+    else:
+        print(f"Diario de cambios no soportado para '{engine.dialect.name}'")
+        return
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+_last_safe_bound = 0
+
+def safe_upper_bound(db) -> int:
+    """Highest seq such that every change up to it is already committed"""
+    global _last_safe_bound
+    if db.get_bind().dialect.name != "postgresql":
+        return db.execute(text("SELECT COALESCE(MAX(seq), 0) FROM cambios")).scalar()
+    for attempt in range(SAFE_BOUND_TRIES):
+        if attempt:
+            time.sleep(SAFE_BOUND_RETRY_SECONDS)
+        locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": CHANGES_LOCK_KEY}).scalar()
+        if locked:
+            bound = db.execute(text("SELECT COALESCE(MAX(seq), 0) FROM cambios")).scalar()
+            db.commit()  # libera el lock
+            _last_safe_bound = max(_last_safe_bound, bound)
+            return bound
+        db.commit()
+    # Hay escrituras en curso: el último límite seguro sigue siéndolo
+    return _last_safe_bound
+
+def trim_changes(db, retention_days: float = CHANGES_RETENTION_DAYS) -> int:
+    """Delete journal entries older than `retention_days`; returns how many"""
+    seconds = retention_days * 86400
+    if db.get_bind().dialect.name == "postgresql":
+        cutoff, params = "now() - make_interval(secs => :seconds)", {"seconds": seconds}
+    else:
+        cutoff, params = "datetime('now', :modifier)", {"modifier": f"-{seconds} seconds"}
+    boundary = db.execute(text(f"SELECT MAX(seq) FROM cambios WHERE fecha < {cutoff}"), params).scalar()
+    if boundary is None:
+        db.rollback()
+        return 0
+    # En la misma transacción que el borrado: GET /api/changes responde 410 a un since menor
+    db.execute(update(RecorteCambios).where(RecorteCambios.hasta_seq < boundary).values(hasta_seq=boundary))
+    result = db.execute(delete(Cambio).where(Cambio.seq <= boundary))
+    db.commit()
+    return result.rowcount
+
+class JournalTrimmer:
+    """Background thread that applies the journal retention"""
+
+    def __init__(self):
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if CHANGES_RETENTION_DAYS <= 0 or CHANGES_TRIM_SECONDS <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._trim_loop, name="changes-trim", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _trim_loop(self):
+        while True:
+            db = SessionLocal()
+            try:
+                deleted = trim_changes(db)
+                if deleted:
+                    print(f"Diario de cambios: {deleted} entradas recortadas")
+            except Exception as e:
+                print(f"No se pudo recortar el diario de cambios: {e}")
+            finally:
+                db.close()
+            if self._stopping.wait(CHANGES_TRIM_SECONDS):
+                break
+
+journal_trimmer = JournalTrimmer()
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import select
+import threading
+from sqlalchemy import text
+
+# Eventos en tiempo real (ej. cambios de estado de pedidos) para los clientes
+# conectados por SSE. Cada usuario escucha su propio canal "usuario:<id>".
+#
+# El broker reparte los eventos entre las suscripciones de este proceso; el
+# backend los lleva de un proceso a otro:
+#   - "memory": solo este proceso (desarrollo, tests, un único worker)
+#   - "postgres": LISTEN/NOTIFY, para varios workers sobre la misma base
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+# Eventos pendientes por conexión; si un cliente no lee, se descartan los más viejos
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def user_channel(id_usuario: int) -> str:
+    return f"usuario:{id_usuario}"
+
+class MemoryBackend:
+    """Delivers events straight to the local broker"""
+
+    def bind(self, deliver):
+        self._deliver = deliver
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, channel: str, data: dict):
+        self._deliver(channel, data)
+
+class PostgresNotifyBackend:
+    """Carries events between workers with PostgreSQL LISTEN/NOTIFY"""
+
+    PG_CHANNEL = "farmago_eventos"
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def bind(self, deliver):
+        self._deliver = deliver
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="pg-listen", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def publish(self, channel: str, data: dict):
+        payload = json.dumps({"channel": channel, "data": data}, default=str)
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:pg_channel, :payload)"), {
+                "pg_channel": self.PG_CHANNEL, "payload": payload
+            })
+            conn.commit()
+
+    def _listen(self):
+        # Conexión propia, fuera del pool: queda abierta mientras viva el proceso
+        while not self._stopping.is_set():
+            try:
+                dialect = self.engine.dialect
+                args, kwargs = dialect.create_connect_args(self.engine.url)
+                conn = dialect.loaded_dbapi.connect(*args, **kwargs)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.PG_CHANNEL}")
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        message = json.loads(notify.payload)
+                        self._deliver(message["channel"], message["data"])
+                conn.close()
+            except Exception as e:
+                print(f"LISTEN/NOTIFY desconectado, reintentando: {e}")
+                self._stopping.wait(2)
+
+class _Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event: dict):
+        # Corre en el loop de la suscripción
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+class EventBroker:
+    """In-process pub/sub: routes publish from any thread, SSE handlers consume with asyncio"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = {}
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self.backend.bind(self._dispatch)
+
+    def publish(self, channels, event_type: str, data: dict):
+        """Publish an event to one or more channels"""
+        for channel in channels:
+            self.backend.publish(channel, {"type": event_type, **data})
+
+    def subscribe(self, channel: str) -> _Subscription:
+        subscription = _Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channel: str, subscription: _Subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[channel]
+
+    def add_listener(self, channel: str, callback):
+        """Call callback(event) synchronously for every event on channel (internal consumers)"""
+        with self._lock:
+            self._listeners.setdefault(channel, []).append(callback)
+
+    def start(self):
+        self.backend.start()
+
+    def stop(self):
+        self.backend.stop()
+
+    def _dispatch(self, channel: str, event: dict):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+            listeners = list(self._listeners.get(channel, ()))
+        for callback in listeners:
+            callback(event)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # El loop ya se cerró (conexión terminada)
+                self.unsubscribe(channel, subscription)
+
+def _build_backend():
+    if EVENTS_BACKEND == "postgres":
+        from database import engine
+        return PostgresNotifyBackend(engine)
+    return MemoryBackend()
+
+broker = EventBroker(_build_backend())
@@ -0,0 +1,59 @@
+import csv
+import io
+import zlib
+
+# Exportaciones a CSV que se generan mientras se envían: se leen las filas con
+# un cursor del lado del servidor y se escriben en bloques de ~64 KB, así la
+# memoria no depende de cuántas filas haya.
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Excel toma como fórmula una celda que empieza con alguno de estos caracteres
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _cell(value, excel: bool = False):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    # Los nombres de medicamentos los carga cualquiera: "=HYPERLINK(...)" no
+    # tiene que llegar vivo a la planilla de la farmacia
+    if excel and isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def csv_chunks(header, rows, gzip: bool = False, excel: bool = False):
+    """Yield the CSV (optionally gzip-compressed) for an iterable of rows, in bytes chunks
+
+    excel=True agrega el BOM UTF-8 y neutraliza las celdas que Excel tomaría como fórmula.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31: formato gzip (encabezado + CRC), se comprime a medida que se genera
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    if excel:
+        # Para que Excel abra el archivo como UTF-8 (acentos, ñ)
+        buffer.write("\ufeff")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_cell(value, excel) for value in row])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+def export_headers(filename: str, gzip: bool) -> dict:
+    """Content-Disposition for a CSV download (.csv or .csv.gz)"""
+    return {"Content-Disposition": f'attachment; filename="{filename}.csv{".gz" if gzip else ""}"'}
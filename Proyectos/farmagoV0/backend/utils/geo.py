@@ -0,0 +1,79 @@
+import math
+from sqlalchemy import event, text, inspect, or_
+from models import Farmacia
+
+KM_PER_DEGREE = 111.32
+
+# Grilla para el índice espacial: celdas de 0.05° (~5.5 km de lado en
+# Buenos Aires). La clave es fila * _GRID_COLS + columna, así las celdas de una
+# misma fila son contiguas y un círculo se cubre con un BETWEEN por fila.
+CELL_DEG = 0.05
+_GRID_ROWS = int(180 / CELL_DEG)
+_GRID_COLS = int(360 / CELL_DEG)
+
+# Las distancias se calculan en la base con la aproximación equirectangular:
+# solo usa sumas y productos (anda igual en SQLite y PostgreSQL) y a escala de
+# ciudad el error frente a haversine es despreciable. Se ordena por la distancia
+# al cuadrado y la raíz se saca solo para las filas de la página.
+
+def squared_distance_km2(lat_column, lon_column, lat: float, lon: float):
+    """SQL expression with the squared distance (km²) from (lat, lon) to a row"""
+    lon_scale = math.cos(math.radians(lat))
+    dy = (lat_column - lat) * KM_PER_DEGREE
+    dx = (lon_column - lon) * (KM_PER_DEGREE * lon_scale)
+    return dy * dy + dx * dx
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def cell_key(lat: float, lon: float):
+    """Grid cell of a coordinate (None if the coordinate is missing)"""
+    if lat is None or lon is None:
+        return None
+    row = min(max(int((lat + 90) // CELL_DEG), 0), _GRID_ROWS - 1)
+    col = min(max(int((lon + 180) // CELL_DEG), 0), _GRID_COLS - 1)
+    return row * _GRID_COLS + col
+
+def cell_ranges(lat: float, lon: float, radius_km: float):
+    """(first, last) cell keys, one per grid row, covering the circle"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    first_row, first_col = divmod(cell_key(min_lat, min_lon), _GRID_COLS)
+    last_row, last_col = divmod(cell_key(max_lat, max_lon), _GRID_COLS)
+    return [
+        (row * _GRID_COLS + first_col, row * _GRID_COLS + last_col)
+        for row in range(first_row, last_row + 1)
+    ]
+
+def within_radius(lat: float, lon: float, radius_km: float):
+    """Filters for pharmacies within radius_km of (lat, lon), served by ix_farmacias_celda_geo"""
+    distance2 = squared_distance_km2(Farmacia.latitud, Farmacia.longitud, lat, lon)
+    return [
+        or_(*[Farmacia.celda_geo.between(first, last) for first, last in cell_ranges(lat, lon, radius_km)]),
+        distance2 <= radius_km * radius_km,
+    ]
+
+@event.listens_for(Farmacia, "before_insert")
+@event.listens_for(Farmacia, "before_update")
+def _fill_cell(mapper, connection, target):
+    target.celda_geo = cell_key(target.latitud, target.longitud)
+
+def setup_geo(engine):
+    """Add the grid column to old databases and backfill pharmacies without a cell"""
+    with engine.begin() as conn:
+        columns = {c["name"] for c in inspect(conn).get_columns("farmacias")}
+        if "celda_geo" not in columns:
+            # El índice lo crea después create_missing_indexes()
+            conn.execute(text("ALTER TABLE farmacias ADD COLUMN celda_geo INTEGER"))
+
+        pending = conn.execute(text(
+            "SELECT id_usuario, latitud, longitud FROM farmacias "
+            "WHERE celda_geo IS NULL AND latitud IS NOT NULL AND longitud IS NOT NULL"
+        )).all()
+        if pending:
+            conn.execute(
+                text("UPDATE farmacias SET celda_geo = :celda WHERE id_usuario = :id"),
+                [{"id": row[0], "celda": cell_key(row[1], row[2])} for row in pending]
+            )
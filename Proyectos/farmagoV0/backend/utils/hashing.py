@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+# Los procesos del pool arrancan con "spawn": importan este módulo (que no toca
+# la base) y el __main__ del worker, que con `python main.py` es main.py; por
+# eso main.py hace el setup de la base en el lifespan y no al importarse. No se
+# usa fork: copiaría un worker con hilos corriendo (broker, réplicas,
+# sugerencias) y pools de conexiones abiertos.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# "process": bcrypt corre en un pool de procesos y no compite por el GIL con
+# el resto de las requests. "inline": en el threadpool de Starlette (como antes).
+PASSWORD_HASH_POOL = os.getenv("PASSWORD_HASH_POOL", "process")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hashes en cola o en curso por worker de uvicorn; pasado eso se responde 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "5"))
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+def _ping() -> bool:
+    return True
+
+class PasswordHasher:
+    """Async bcrypt service backed by a bounded process pool"""
+
+    def __init__(self, mode: str = PASSWORD_HASH_POOL, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING, timeout: float = PASSWORD_HASH_TIMEOUT_SECONDS):
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._pending = 0
+
+    def _get_pool(self):
+        # Se crea en el primer uso, ya dentro del proceso del worker de uvicorn
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _call(self, fn, *args):
+        if self.mode == "inline":
+            return await run_in_threadpool(fn, *args)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # Murió un proceso del pool (OOM, kill): el executor no se recupera
+            # solo. Se reemplaza (si otro request no lo hizo ya) y se reintenta.
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Servidor ocupado, intentá de nuevo en unos segundos")
+        self._pending += 1
+        try:
+            return await asyncio.wait_for(self._call(fn, *args), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Servidor ocupado, intentá de nuevo en unos segundos")
+        finally:
+            self._pending -= 1
+
+    async def warm_up(self):
+        """Start the pool processes now instead of on the first login"""
+        if self.mode != "inline":
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._get_pool(), _ping) for _ in range(self.workers)))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Response
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Cuánto espera un reintento a que termine la request original
+IDEMPOTENCY_WAIT_SECONDS = 30
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+class _Entry:
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+class IdempotencyStore:
+    """In-memory store of responses keyed by (scope, user, Idempotency-Key)
+
+    Solo se guardan las respuestas exitosas: si la request original falla
+    (ej. stock insuficiente) la clave se libera y el reintento se ejecuta de nuevo.
+    """
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Todas las entradas tienen el mismo TTL, así que las más viejas están adelante
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            expired = oldest.expires_at <= now
+            # Por tamaño no se desaloja una request que sigue en curso
+            over_capacity = len(self._entries) > self.max_entries and oldest.done.is_set()
+            if not expired and not over_capacity:
+                break
+            self._entries.popitem(last=False)
+
+    def run(self, key: tuple, fingerprint: str, fn):
+        """Run fn() once per key; returns (result, replayed)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._evict(now)
+                entry = self._entries.get(key)
+                if entry is None or entry.expires_at <= now:
+                    self._entries.pop(key, None)
+                    entry = _Entry(fingerprint, now + self.ttl_seconds)
+                    self._entries[key] = entry
+                    owner = True
+                else:
+                    owner = False
+
+            if owner:
+                try:
+                    entry.result = fn()
+                except BaseException:
+                    entry.failed = True
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                    raise
+                finally:
+                    entry.done.set()
+                return entry.result, False
+
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail="La Idempotency-Key ya se usó con otra solicitud"
+                )
+            # Duplicado concurrente: esperamos el resultado del primero
+            if not entry.done.wait(IDEMPOTENCY_WAIT_SECONDS):
+                raise HTTPException(status_code=409, detail="La solicitud original todavía está en curso")
+            if not entry.failed:
+                return entry.result, True
+            # La original falló: este reintento toma su lugar
+
+idempotency_store = IdempotencyStore()
+
+def run_idempotent(scope: str, user_id: int, idempotency_key: str, payload, response: Response, fn):
+    """Execute fn() honoring the Idempotency-Key header (no header: just run it)"""
+    if not idempotency_key:
+        return fn()
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+    body = json.dumps(payload.model_dump(mode="json"), sort_keys=True)
+    fingerprint = hashlib.sha256(body.encode()).hexdigest()
+    result, replayed = idempotency_store.run((scope, user_id, idempotency_key), fingerprint, fn)
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
@@ -0,0 +1,231 @@
+import codecs
+import csv
+import json
+import os
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import func, inspect, text, update
+from models import Medicamento, StockMedicamento
+from schemas import StockMedicamentoCreate
+
+# Sincronización masiva de stock desde el sistema de la farmacia (POS).
+# Cada lote es un solo INSERT ... ON CONFLICT (id_farmacia, id_medicamento) DO UPDATE.
+BULK_STOCK_BATCH_SIZE = int(os.getenv("BULK_STOCK_BATCH_SIZE", "1000"))
+BULK_STOCK_MAX_ROWS = int(os.getenv("BULK_STOCK_MAX_ROWS", "50000"))
+# Tope del cuerpo, antes de parsear: el de filas solo se puede contar después
+BULK_STOCK_MAX_BYTES = int(os.getenv("BULK_STOCK_MAX_BYTES", str(10 * 1024 * 1024)))
+STOCK_UNIQUE_INDEX = "uq_stock_farmacia_medicamento"
+CSV_COLUMNS = ("id_medicamento", "precio", "cantidad_disponible")
+
+def duplicate_stock_pairs(conn) -> list:
+    """[(id_farmacia, id_medicamento, filas), ...] pairs with more than one stock row"""
+    return conn.execute(text(
+        "SELECT id_farmacia, id_medicamento, COUNT(*) FROM stock_medicamentos "
+        "GROUP BY id_farmacia, id_medicamento HAVING COUNT(*) > 1 "
+        "ORDER BY id_farmacia, id_medicamento"
+    )).all()
+
+def setup_inventory(engine):
+    """Refuse to start if duplicate stock rows would block the unique index"""
+    with engine.connect() as conn:
+        indexes = {i["name"] for i in inspect(conn).get_indexes("stock_medicamentos")}
+        if STOCK_UNIQUE_INDEX in indexes:
+            return
+        # El índice lo crea después create_missing_indexes(); con duplicados
+        # fallaría, y borrarlos acá perdería cantidades sin avisar.
+        duplicates = duplicate_stock_pairs(conn)
+    if duplicates:
+        raise RuntimeError(
+            f"stock_medicamentos tiene {len(duplicates)} pares (farmacia, medicamento) repetidos "
+            f"y no se puede crear {STOCK_UNIQUE_INDEX}: correr scripts/merge_duplicate_stock.py"
+        )
+
+def _dialect_insert(bind):
+    name = bind.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Upsert de stock no soportado para '{name}'")
+    return insert
+
+def upsert_stock(db, rows: list):
+    """INSERT ... ON CONFLICT DO UPDATE for a list of stock dicts, in batches (no commit)"""
+    insert = _dialect_insert(db.get_bind())
+    for start in range(0, len(rows), BULK_STOCK_BATCH_SIZE):
+        stmt = insert(StockMedicamento).values(rows[start:start + BULK_STOCK_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockMedicamento.id_farmacia, StockMedicamento.id_medicamento],
+            set_={
+                "precio": stmt.excluded.precio,
+                "cantidad_disponible": stmt.excluded.cantidad_disponible,
+                "fecha_actualizacion": func.now(),
+            }
+        )
+        db.execute(stmt)
+
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Máximo {BULK_STOCK_MAX_BYTES} bytes por envío")
+
+async def _body_chunks(request: Request):
+    """request.stream(), cut with 413 once it goes past BULK_STOCK_MAX_BYTES"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > BULK_STOCK_MAX_BYTES:
+        raise _too_large()
+    # Content-Length puede faltar (chunked) o mentir: se cuenta igual
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > BULK_STOCK_MAX_BYTES:
+            raise _too_large()
+        yield chunk
+
+async def _read_csv(request: Request):
+    # Se decodifica a medida que llega; cada línea conserva su "\n" para que
+    # csv acepte campos entre comillas que ocupan varias líneas.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    lines = []
+    async for chunk in _body_chunks(request):
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        lines.extend(line + "\n" for line in complete)
+        if len(lines) > BULK_STOCK_MAX_ROWS + 1:
+            raise HTTPException(status_code=413, detail=f"Máximo {BULK_STOCK_MAX_ROWS} filas por envío")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        lines.append(pending)
+
+    reader = csv.DictReader(lines)
+    missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Faltan columnas en el CSV: {', '.join(missing)}")
+    return [{c: (row[c] or "").strip() for c in CSV_COLUMNS} for row in reader]
+
+async def read_stock_rows(request: Request) -> list:
+    """Raw rows from a JSON array or a CSV body (Content-Type: text/csv)"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("text/csv"):
+        rows = await _read_csv(request)
+    else:
+        try:
+            rows = json.loads(b"".join([chunk async for chunk in _body_chunks(request)]))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Se esperaba una lista de filas de stock")
+    if len(rows) > BULK_STOCK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_STOCK_MAX_ROWS} filas por envío")
+    return rows
+
+def validate_stock_rows(db, rows: list):
+    """Validate raw rows; returns ({id_medicamento: (fila, StockMedicamentoCreate)}, errors)
+
+    Si un medicamento aparece varias veces gana la última fila; las anteriores
+    se informan como ignoradas.
+    """
+    valid = {}
+    results = []
+    for fila, raw in enumerate(rows, start=1):
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError
+            item = StockMedicamentoCreate(**raw)
+        except (ValidationError, ValueError, TypeError):
+            results.append({"fila": fila, "id_medicamento": None, "estado": "error",
+                            "detalle": "Fila inválida: se esperan id_medicamento, precio y cantidad_disponible"})
+            continue
+        if item.precio < 0 or item.cantidad_disponible < 0:
+            results.append({"fila": fila, "id_medicamento": item.id_medicamento, "estado": "error",
+                            "detalle": "Precio y cantidad no pueden ser negativos"})
+            continue
+        previous = valid.get(item.id_medicamento)
+        if previous:
+            results.append({"fila": previous[0], "id_medicamento": item.id_medicamento, "estado": "ignorado",
+                            "detalle": f"Reemplazada por la fila {fila}"})
+        valid[item.id_medicamento] = (fila, item)
+
+    # Un solo query por lote para saber qué medicamentos existen
+    ids = list(valid)
+    known = set()
+    for start in range(0, len(ids), BULK_STOCK_BATCH_SIZE):
+        batch = ids[start:start + BULK_STOCK_BATCH_SIZE]
+        known.update(
+            id for (id,) in db.query(Medicamento.id_medicamento).filter(Medicamento.id_medicamento.in_(batch))
+        )
+    for id_medicamento in [i for i in ids if i not in known]:
+        fila, _ = valid.pop(id_medicamento)
+        results.append({"fila": fila, "id_medicamento": id_medicamento, "estado": "error",
+                        "detalle": "Medicamento no encontrado"})
+    return valid, results
+
+def diff_snapshot(current: dict, incoming: dict):
+    """Minimal change set between stored and incoming rows, in one pass
+
+    current:  {id_medicamento: (precio, cantidad_disponible)} de la base
+    incoming: {id_medicamento: (precio, cantidad_disponible)} del snapshot
+    Returns (inserts, updates, zeroed, unchanged): los tres primeros son listas
+    de id_medicamento; lo que falta en el snapshot se pone en cantidad 0.
+    """
+    inserts, updates, unchanged = [], [], 0
+    for id_medicamento, (precio, cantidad) in incoming.items():
+        stored = current.get(id_medicamento)
+        if stored is None:
+            inserts.append(id_medicamento)
+        # precio es float: se compara a centavos
+        elif (round(stored[0], 2), stored[1]) != (round(precio, 2), cantidad):
+            updates.append(id_medicamento)
+        else:
+            unchanged += 1
+    zeroed = [
+        id_medicamento for id_medicamento, (_, cantidad) in current.items()
+        if id_medicamento not in incoming and cantidad != 0
+    ]
+    return inserts, updates, zeroed, unchanged
+
+def reconcile_snapshot(db, id_farmacia: int, valid: dict, dry_run: bool = False) -> dict:
+    """Apply a full inventory snapshot: only the rows that differ are written
+
+    `valid` es la salida de validate_stock_rows(). Todo va en una transacción.
+    """
+    current = {
+        id_medicamento: (precio, cantidad)
+        for id_medicamento, precio, cantidad in db.query(
+            StockMedicamento.id_medicamento, StockMedicamento.precio, StockMedicamento.cantidad_disponible
+        ).filter(StockMedicamento.id_farmacia == id_farmacia)
+    }
+    incoming = {
+        id_medicamento: (item.precio, item.cantidad_disponible)
+        for id_medicamento, (_, item) in valid.items()
+    }
+    inserts, updates, zeroed, unchanged = diff_snapshot(current, incoming)
+
+    if not dry_run:
+        upsert_stock(db, [
+            {
+                "id_farmacia": id_farmacia,
+                "id_medicamento": id_medicamento,
+                "precio": incoming[id_medicamento][0],
+                "cantidad_disponible": incoming[id_medicamento][1],
+            }
+            for id_medicamento in inserts + updates
+        ])
+        for start in range(0, len(zeroed), BULK_STOCK_BATCH_SIZE):
+            db.execute(
+                update(StockMedicamento)
+                .where(
+                    StockMedicamento.id_farmacia == id_farmacia,
+                    StockMedicamento.id_medicamento.in_(zeroed[start:start + BULK_STOCK_BATCH_SIZE])
+                )
+                .values(cantidad_disponible=0, fecha_actualizacion=func.now())
+            )
+        db.commit()
+
+    return {
+        "insertados": len(inserts),
+        "actualizados": len(updates),
+        "puestos_en_cero": len(zeroed),
+        "sin_cambios": unchanged,
+        "dry_run": dry_run
+    }
@@ -0,0 +1,202 @@
+import bisect
+import contextvars
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils.pool_stats import pool_registry
+
+# Métricas en formato de texto de Prometheus (GET /metrics), sin dependencias:
+#   - latencia de cada request por método, ruta (el template, no la URL) y status
+#   - queries SQL y tiempo en la base por request, por ruta
+#   - los pools de conexiones de utils/pool_stats.py
+# Las queries se cuentan con before/after_cursor_execute sobre todos los
+# engines (también los async); el request en curso se sigue con un ContextVar,
+# que Starlette copia a los hilos donde corren las rutas sync.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+UNMATCHED_ROUTE = "sin_ruta"
+
+class Histogram:
+    """Prometheus histogram keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [conteo por bucket (no acumulado)..., +Inf], suma
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+
+class Counter:
+    """Monotonic counter without labels"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} counter")
+        lines.append(f"{self.name} {self.value}")
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+request_duration = Histogram(
+    "farmago_http_request_duration_seconds", "Request latency by route",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    "farmago_http_request_db_queries", "SQL statements executed per request",
+    ("method", "route"), QUERY_COUNT_BUCKETS
+)
+request_db_time = Histogram(
+    "farmago_http_request_db_seconds", "Time spent in the database per request",
+    ("method", "route"), DB_TIME_BUCKETS
+)
+db_queries_total = Counter("farmago_db_queries_total", "SQL statements executed (requests and background work)")
+db_seconds_total = Counter("farmago_db_query_seconds_total", "Time spent executing SQL statements")
+
+class _RequestDB:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+_current_request = contextvars.ContextVar("farmago_request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de la ejecución y no en conn.info: si la query falla no hay
+    # after_cursor_execute, y el inicio se descarta junto con el contexto
+    if context is not None:
+        context.farmago_query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "farmago_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    db_queries_total.inc()
+    db_seconds_total.inc(elapsed)
+    current = _current_request.get()
+    if current is not None:
+        current.queries += 1
+        current.seconds += elapsed
+
+def install_db_hooks():
+    """Count every SQL statement of every engine (sync and async)"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+class MetricsMiddleware:
+    """Record latency, query count and DB time of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = _RequestDB()
+        token = _current_request.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_request.reset(token)
+            # El router deja la ruta elegida en el scope: se agrupa por template
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            request_duration.observe((method, path, status[0]), elapsed)
+            request_queries.observe((method, path), stats.queries)
+            request_db_time.observe((method, path), stats.seconds)
+
+def _render_pools(lines: list):
+    gauges = [
+        ("farmago_db_pool_size", "Connections kept open by the pool", lambda pool, stats: pool.size()),
+        ("farmago_db_pool_in_use", "Connections checked out right now", lambda pool, stats: pool.checkedout()),
+        ("farmago_db_pool_idle", "Idle connections in the pool", lambda pool, stats: pool.checkedin()),
+        ("farmago_db_pool_overflow", "Connections open beyond pool_size", lambda pool, stats: max(0, pool.overflow())),
+    ]
+    counters = [
+        ("farmago_db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT", "timeouts"),
+        ("farmago_db_pool_connects_total", "New DBAPI connections opened", "connects"),
+        ("farmago_db_pool_invalidations_total", "Connections discarded as broken", "invalidations"),
+    ]
+    pools = [(name, getattr(engine, "sync_engine", engine).pool, stats) for name, (engine, stats) in pool_registry.items()]
+
+    for metric, help_text, read in gauges:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for name, pool, stats in pools:
+            lines.append(f'{metric}{{pool="{_escape(name)}"}} {read(pool, stats)}')
+    for metric, help_text, attribute in counters:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, pool, stats in pools:
+            lines.append(f'{metric}{{pool="{_escape(name)}"}} {getattr(stats, attribute)}')
+
+    metric = "farmago_db_pool_checkout_wait_seconds"
+    lines.append(f"# HELP {metric} Time waited for a pooled connection")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, pool, stats in pools:
+        label = f'pool="{_escape(name)}"'
+        for bound, count in stats.cumulative_buckets():
+            le = bound if bound == "+Inf" else bound / 1000
+            lines.append(f'{metric}_bucket{{{label},le="{le}"}} {count}')
+        lines.append(f"{metric}_sum{{{label}}} {stats.checkout_ms_total / 1000}")
+        lines.append(f"{metric}_count{{{label}}} {stats.checkouts}")
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in (request_duration, request_queries, request_db_time, db_queries_total, db_seconds_total):
+        metric.render(lines)
+    _render_pools(lines)
+    return "\n".join(lines) + "\n"
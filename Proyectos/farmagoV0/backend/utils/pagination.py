@@ -0,0 +1,48 @@
+import base64
+import json
+from fastapi import HTTPException, Response
+from sqlalchemy import String, or_, and_
+
+# El cuerpo de los listados sigue siendo una lista (el front ya lo espera así);
+# el cursor de la página siguiente viaja en este header.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(data: dict) -> str:
+    """Encode a cursor payload as an opaque url-safe string"""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return data
+
+def set_next_cursor(response: Response, data: dict = None):
+    """Expose the next page cursor (if any) in the response headers"""
+    if data is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(data)
+
+def _cursor_value_fits(key, value) -> bool:
+    # Texto para columnas de texto y números para el resto (bool no cuenta como número)
+    if isinstance(key.type, String):
+        return isinstance(value, str)
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def keyset_after(keys: list, values: list):
+    """WHERE clause for the rows that come after `values` when ordering by `keys` (all ascending)"""
+    # Los valores vienen del cursor: uno por clave y del tipo de la clave, o 400
+    if len(keys) != len(values) or not all(map(_cursor_value_fits, keys, values)):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return _keyset_after(keys, values)
+
+def _keyset_after(keys: list, values: list):
+    key, value = keys[0], values[0]
+    if len(keys) == 1:
+        return key > value
+    return or_(key > value, and_(key == value, _keyset_after(keys[1:], values[1:])))
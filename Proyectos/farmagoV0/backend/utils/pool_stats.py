@@ -0,0 +1,122 @@
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Métricas de los pools de conexiones: cuánto se espera para sacar una
+# conexión, cuántas esperas terminan en timeout y cuántas conexiones están en
+# uso / en overflow. No depende de database.py (que importa este módulo para
+# armar los engines).
+CHECKOUT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class PoolStats:
+    """Checkout latency histogram and event counters of one pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+        self.checkouts = 0
+        self.checkout_ms_total = 0.0
+        self.checkout_ms_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def observe_checkout(self, elapsed_ms: float):
+        with self._lock:
+            self._buckets[bisect.bisect_left(CHECKOUT_BUCKETS_MS, elapsed_ms)] += 1
+            self.checkouts += 1
+            self.checkout_ms_total += elapsed_ms
+            self.checkout_ms_max = max(self.checkout_ms_max, elapsed_ms)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def cumulative_buckets(self):
+        """[(upper bound in ms or "+Inf", checkouts at or below it), ...]"""
+        with self._lock:
+            counts = list(self._buckets)
+        result, total = [], 0
+        for bound, count in zip(list(CHECKOUT_BUCKETS_MS) + ["+Inf"], counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self, pool) -> dict:
+        """Current gauges of `pool` plus the counters since startup"""
+        return {
+            "tamaño": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            # overflow() arranca en -pool_size y llega a 0 cuando el pool se llena
+            "overflow": max(0, pool.overflow()),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "conexiones_abiertas": self.connects,
+            "invalidadas": self.invalidations,
+            "espera_ms": {
+                "total": round(self.checkout_ms_total, 3),
+                "max": round(self.checkout_ms_max, 3),
+                "buckets": {str(bound): count for bound, count in self.cumulative_buckets()},
+            },
+        }
+
+class _TimedCheckout:
+    # No hay evento de pool antes del checkout: se mide envolviendo connect()
+    stats: PoolStats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            if self.stats:
+                self.stats.record_timeout()
+            raise
+        if self.stats:
+            self.stats.observe_checkout((time.perf_counter() - start) * 1000)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() reemplaza el pool: las métricas siguen en el nuevo
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+
+# nombre -> (engine, PoolStats), en el orden en que se registraron
+pool_registry = {}
+
+def instrument_engine(name: str, engine):
+    """Attach PoolStats to the engine's pool (sync or async engine)"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    stats = PoolStats(name)
+    pool.stats = stats
+    event.listen(pool, "connect", lambda dbapi_connection, record: stats.record_connect())
+    event.listen(pool, "invalidate", lambda dbapi_connection, record, exception: stats.record_invalidation())
+    pool_registry[name] = (engine, stats)
+    return stats
+
+def pool_snapshot() -> dict:
+    """Gauges and counters of every instrumented pool"""
+    return {
+        name: stats.snapshot(getattr(engine, "sync_engine", engine).pool)
+        for name, (engine, stats) in pool_registry.items()
+    }
@@ -0,0 +1,130 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+
+# Token bucket: cada clave arranca con `capacity` intentos y recupera `rate`
+# intentos por segundo. Protege el CPU de bcrypt ante fuerza bruta o
+# credential stuffing: un intento rechazado no toca la base ni hashea nada.
+#
+# RATE_LIMIT_BACKEND:
+#   - "memory": por proceso (un solo worker o desarrollo)
+#   - "redis": compartido entre workers (requiere el paquete `redis` y REDIS_URL)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+LOGIN_IP_CAPACITY = int(os.getenv("LOGIN_IP_CAPACITY", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "20"))
+LOGIN_EMAIL_CAPACITY = int(os.getenv("LOGIN_EMAIL_CAPACITY", "5"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "1"))
+# Proxies propios delante de la app (nginx, balanceador). Cada uno agrega la
+# IP que le habló al final de X-Forwarded-For: la del cliente es la que está a
+# TRUSTED_PROXY_HOPS lugares del final. Con 0 se usa la IP de la conexión.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+def client_ip(request: Request) -> str:
+    """Address of the client, skipping TRUSTED_PROXY_HOPS proxies"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXY_HOPS > 0 and forwarded:
+        # Lo que está más a la izquierda lo puede escribir el cliente: no se usa
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "desconocido"
+
+class MemoryBucketStore:
+    """Token buckets in this process's memory (bounded number of keys)"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1):
+        """Consume `cost` tokens (negative gives them back); returns (allowed, seconds until the next token)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens = min(capacity, tokens - cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis"""
+
+    # Leer, recargar y descontar en un solo paso atómico del lado de Redis
+    _SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = math.min(capacity, tokens - cost)
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requiere el paquete 'redis' (pip install redis)")
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self._SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1):
+        allowed, tokens = self._take(keys=[f"farmago:ratelimit:{key}"], args=[capacity, rate, time.time(), cost])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+class LoginRateLimiter:
+    """Per-IP and per-email buckets for POST /api/auth/login"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _email_bucket(self, email: str):
+        return f"login:email:{email.strip().lower()}", LOGIN_EMAIL_CAPACITY, LOGIN_EMAIL_PER_MINUTE / 60
+
+    def check(self, ip: str, email: str):
+        """Raise 429 (with Retry-After) if this IP or this email ran out of attempts"""
+        # El intento del email se reserva acá (antes de bcrypt) y se devuelve si
+        # la contraseña era correcta: solo los fallidos gastan ese bucket
+        checks = [
+            (f"login:ip:{ip}", LOGIN_IP_CAPACITY, LOGIN_IP_PER_MINUTE / 60),
+            self._email_bucket(email),
+        ]
+        for key, capacity, rate in checks:
+            allowed, retry_after = self.store.take(key, capacity, rate)
+            if not allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Demasiados intentos de inicio de sesión, probá más tarde",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+                )
+
+    def succeeded(self, email: str):
+        """Give back the email attempt reserved by check()"""
+        self.store.take(*self._email_bucket(email), cost=-1)
+
+def _build_store():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketStore()
+    return MemoryBucketStore()
+
+login_limiter = LoginRateLimiter(_build_store())
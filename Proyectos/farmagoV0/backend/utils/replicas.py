@@ -0,0 +1,211 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from functools import partial
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from database import engine, async_engine, SessionLocal, AsyncSessionLocal, replica_engines, async_replica_engines
+from utils.cache import TTLCache
+
+# Ruteo de lecturas a réplicas (DATABASE_REPLICA_URLS en database.py).
+#
+# Las rutas GET piden la sesión con get_read_db / get_async_read_db: se elige
+# una réplica sana por round-robin y, si no hay ninguna, el primario. Van al
+# primario igual:
+#   - los usuarios (por token) que escribieron hace menos de
+#     READ_AFTER_WRITE_SECONDS, así leen lo que acaban de guardar aunque la
+#     réplica venga atrasada
+#   - todas las lecturas durante ese mismo tiempo después de un cambio del
+#     catálogo, para que la caché del catálogo no guarde datos viejos
+#
+# Las sesiones no se conectan hasta la primera query (un 304 o un acierto de
+# caché no usan la réplica). Una réplica deja de elegirse cuando una query real
+# no puede conectarse o pierde la conexión, y vuelve cuando el hilo de chequeo
+# la encuentra sana. Si eso pasa en la primera query de la sesión, se repite en
+# el primario y el request no se entera.
+REPLICA_HEALTHCHECK_SECONDS = float(os.getenv("REPLICA_HEALTHCHECK_SECONDS", "5"))
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "5"))
+READ_AFTER_WRITE_MAX_CLIENTS = 100_000
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Session.info de una sesión de réplica que todavía no hizo ninguna query
+REPLICA_FALLBACK_KEY = "farmago_replica_fallback"
+
+logger = logging.getLogger(__name__)
+
+def client_key(authorization: Optional[str]) -> Optional[str]:
+    """Who is reading/writing, by bearer token (anonymous requests have no key)"""
+    if not authorization:
+        return None
+    return hashlib.sha1(authorization.encode()).hexdigest()
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas, falling back to the primary"""
+
+    def __init__(self, engines, async_engines=None):
+        self.engines = engines
+        self.async_engines = async_engines or []
+        self.healthy = [True] * len(engines)
+        self._counter = itertools.count()
+        self._recent_writes = TTLCache(maxsize=READ_AFTER_WRITE_MAX_CLIENTS, ttl=READ_AFTER_WRITE_SECONDS)
+        self._pinned_until = 0.0
+        self._stopping = threading.Event()
+        self._thread = None
+        for index, engine in enumerate(self.engines):
+            event.listen(engine, "handle_error", partial(self._on_error, index))
+        for index, engine in enumerate(self.async_engines):
+            event.listen(engine.sync_engine, "handle_error", partial(self._on_error, index))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def mark_write(self, key: str):
+        """The client `key` just wrote: its reads go to the primary for a while"""
+        self._recent_writes.set(key, True)
+
+    def pin_primary(self, seconds: float = READ_AFTER_WRITE_SECONDS):
+        """Send every read to the primary for `seconds`"""
+        self._pinned_until = time.monotonic() + seconds
+
+    def pick(self, key: Optional[str] = None) -> Optional[int]:
+        """Index of the replica for this read, or None for the primary"""
+        if not self.engines or time.monotonic() < self._pinned_until:
+            return None
+        if key is not None and self._recent_writes.get(key):
+            return None
+        healthy = [index for index, ok in enumerate(self.healthy) if ok]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def mark_down(self, index: int, error):
+        if self.healthy[index]:
+            logger.warning("Réplica %s fuera de servicio: %s", index, error)
+        self.healthy[index] = False
+
+    def _on_error(self, index: int, context):
+        # Sin conexión (falló el connect) o conexión caída; un error del SQL no cuenta
+        if context.connection is None or context.is_disconnect:
+            self.mark_down(index, context.original_exception)
+
+    def session(self, index: Optional[int]):
+        """Session on replica `index`, or on the primary (connects on first use)"""
+        if index is not None:
+            return SessionLocal(bind=self.engines[index], info={REPLICA_FALLBACK_KEY: (index, engine)})
+        return SessionLocal()
+
+    def async_session(self, index: Optional[int]):
+        """Same as session() with the async engines"""
+        if index is not None and self.async_engines:
+            return AsyncSessionLocal(
+                bind=self.async_engines[index], info={REPLICA_FALLBACK_KEY: (index, async_engine.sync_engine)}
+            )
+        return AsyncSessionLocal()
+
+    def _first_query(self, state):
+        # do_orm_execute de todas las sesiones; solo actúa en la primera query
+        # de una sesión de réplica (en async corre dentro del greenlet)
+        session = state.session
+        fallback = session.info.pop(REPLICA_FALLBACK_KEY, None)
+        if fallback is None:
+            return None
+        index, primary = fallback
+        try:
+            return state.invoke_statement()
+        except (DBAPIError, OSError) as e:
+            if isinstance(e, OSError):
+                self.mark_down(index, e)
+            elif self.healthy[index]:
+                # _on_error no la marcó: es un error del SQL, no de la réplica
+                raise
+            session.rollback()
+            session.bind = primary
+            return state.invoke_statement()
+
+    def check(self):
+        """Ping every replica and update its health"""
+        for index, engine in enumerate(self.engines):
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except Exception as e:
+                self.mark_down(index, e)
+                continue
+            if not self.healthy[index]:
+                logger.info("Réplica %s disponible de nuevo", index)
+            self.healthy[index] = True
+
+    def start(self):
+        if not self.engines or REPLICA_HEALTHCHECK_SECONDS <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._check_loop, name="replica-healthcheck", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _check_loop(self):
+        while True:
+            self.check()
+            if self._stopping.wait(REPLICA_HEALTHCHECK_SECONDS):
+                break
+
+replica_router = ReplicaRouter(replica_engines, async_replica_engines)
+if replica_router.enabled:
+    event.listen(Session, "do_orm_execute", replica_router._first_query)
+
+def read_session():
+    """Session for a long read outside a request (exports, NDJSON streams)"""
+    return replica_router.session(replica_router.pick())
+
+def get_read_db(request: Request):
+    """Like get_db, but on a replica when this read can tolerate replication lag"""
+    key = client_key(request.headers.get("authorization"))
+    db = replica_router.session(replica_router.pick(key))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Like get_async_db, on a replica when possible"""
+    key = client_key(request.headers.get("authorization"))
+    db = replica_router.async_session(replica_router.pick(key))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+class ReadAfterWriteMiddleware:
+    """Remember the clients that sent a write so their next reads hit the primary"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            return await self.app(scope, receive, send)
+
+        authorization = dict(scope["headers"]).get(b"authorization")
+        key = client_key(authorization.decode("latin-1") if authorization else None)
+        if key is None:
+            # Login y registro: no hay lecturas propias que proteger
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            # Se marca al empezar la respuesta: para entonces la escritura ya se confirmó
+            if message["type"] == "http.response.start":
+                replica_router.mark_write(key)
+            await send(message)
+
+        replica_router.mark_write(key)
+        await self.app(scope, receive, send_wrapper)
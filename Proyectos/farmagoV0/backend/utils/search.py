@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from sqlalchemy import event, text, func, case, or_, inspect, Integer, Float
+from sqlalchemy.orm import Session
+from models import Medicamento
+
+# Motor de búsqueda elegido por setup_search(): "trigram" (PostgreSQL + pg_trgm),
+# "fts5" (SQLite) o "like" si el motor no tiene ninguno de los dos.
+_backend = "like"
+
+_POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_medicamentos_texto_busqueda_trgm "
+    "ON medicamentos USING gin (texto_busqueda gin_trgm_ops)",
+]
+
+_SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS medicamentos_fts USING fts5(
+        texto_busqueda, content='medicamentos', content_rowid='id_medicamento'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS medicamentos_fts_ai AFTER INSERT ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(rowid, texto_busqueda) VALUES (new.id_medicamento, new.texto_busqueda);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medicamentos_fts_ad AFTER DELETE ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(medicamentos_fts, rowid, texto_busqueda)
+        VALUES ('delete', old.id_medicamento, old.texto_busqueda);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS medicamentos_fts_au AFTER UPDATE ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(medicamentos_fts, rowid, texto_busqueda)
+        VALUES ('delete', old.id_medicamento, old.texto_busqueda);
+        INSERT INTO medicamentos_fts(rowid, texto_busqueda) VALUES (new.id_medicamento, new.texto_busqueda);
+    END""",
+]
+
+def normalize_text(value: str) -> str:
+    """Lowercase and strip accents so 'Ácido' and 'acido' match"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+def build_search_text(nombre_comercial: str, principio_activo: str) -> str:
+    """Text indexed for a medication (commercial name first, then active ingredient)"""
+    return normalize_text(f"{nombre_comercial or ''} {principio_activo or ''}")
+
+@event.listens_for(Medicamento, "before_insert")
+@event.listens_for(Medicamento, "before_update")
+def _fill_search_text(mapper, connection, target):
+    target.texto_busqueda = build_search_text(target.nombre_comercial, target.principio_activo)
+
+def setup_search(engine):
+    """Prepare the search index for the current dialect and backfill old rows"""
+    global _backend
+
+    with engine.begin() as conn:
+        # create_all no agrega columnas a tablas existentes
+        columns = {c["name"] for c in inspect(conn).get_columns("medicamentos")}
+        if "texto_busqueda" not in columns:
+            conn.execute(text("ALTER TABLE medicamentos ADD COLUMN texto_busqueda TEXT"))
+
+        pending = conn.execute(text(
+            "SELECT id_medicamento, nombre_comercial, principio_activo "
+            "FROM medicamentos WHERE texto_busqueda IS NULL"
+        )).all()
+        if pending:
+            conn.execute(
+                text("UPDATE medicamentos SET texto_busqueda = :texto WHERE id_medicamento = :id"),
+                [{"id": row[0], "texto": build_search_text(row[1], row[2])} for row in pending]
+            )
+
+    if engine.dialect.name == "postgresql":
+        statements, backend = _POSTGRES_TRGM_DDL, "trigram"
+    elif engine.dialect.name == "sqlite":
+        statements, backend = _SQLITE_FTS_DDL, "fts5"
+    else:
+        _backend = "like"
+        return
+
+    try:
+        with engine.begin() as conn:
+            created = "medicamentos_fts" not in inspect(conn).get_table_names()
+            for statement in statements:
+                conn.execute(text(statement))
+            if backend == "fts5" and created:
+                conn.execute(text("INSERT INTO medicamentos_fts(medicamentos_fts) VALUES ('rebuild')"))
+    except Exception as e:
+        print(f"Índice de búsqueda '{backend}' no disponible, se usa LIKE: {e}")
+        _backend = "like"
+        return
+    _backend = backend
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_ranking(db: Session, query: str):
+    """Ranked query of medications matching `query` plus its sort keys
+
+    Devuelve (query, claves): el query ya viene ordenado por las claves, todas
+    ascendentes y con id_medicamento al final, para paginar por keyset.
+    None si no hay nada que buscar.
+    """
+    normalized = normalize_text(query)
+
+    if _backend == "fts5":
+        tokens = re.findall(r"\w+", normalized)
+        if not tokens:
+            return None
+        # Cada palabra se busca como prefijo: "ibu 400" -> "ibu"* "400"*
+        match = " ".join(f'"{token}"*' for token in tokens)
+        fts = text(
+            "SELECT rowid AS id, bm25(medicamentos_fts) AS rank "
+            "FROM medicamentos_fts WHERE medicamentos_fts MATCH :match"
+        ).bindparams(match=match).columns(id=Integer, rank=Float).subquery()
+        keys = [fts.c.rank, Medicamento.id_medicamento]
+        results = db.query(Medicamento).join(fts, fts.c.id == Medicamento.id_medicamento)
+        return results.order_by(*keys), keys
+
+    pattern = f"%{escape_like(normalized)}%"
+    prefix = case((Medicamento.texto_busqueda.like(f"{escape_like(normalized)}%", escape="\\"), 1.0), else_=0.0)
+
+    if _backend == "trigram":
+        # LIKE '%q%' y el operador % de pg_trgm se resuelven con el índice GIN trigram
+        score = func.similarity(Medicamento.texto_busqueda, normalized) + prefix
+        keys = [-score, Medicamento.id_medicamento]
+        results = db.query(Medicamento).filter(or_(
+            Medicamento.texto_busqueda.like(pattern, escape="\\"),
+            Medicamento.texto_busqueda.bool_op("%")(normalized)
+        ))
+        return results.order_by(*keys), keys
+
+    keys = [-prefix, Medicamento.nombre_comercial, Medicamento.id_medicamento]
+    results = db.query(Medicamento).filter(Medicamento.texto_busqueda.like(pattern, escape="\\"))
+    return results.order_by(*keys), keys
+
+def search_medications_query(db: Session, query: str):
+    """Build a ranked query of medications matching `query` (best match first)"""
+    ranking = search_ranking(db, query)
+    return ranking[0] if ranking else None
@@ -7,21 +7,43 @@ from fastapi import Depends, HTTPException, status
 # =================================================================
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials as HTTPAuthCredentials
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from dataclasses import dataclass
 import jwt
 from database import get_db
 from models import Usuario
+from utils.cache import TTLCache
+from utils.hashing import pwd_context
 import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 security = HTTPBearer()
+# Para endpoints que también aceptan el token por otro lado (ej. SSE con ?token=)
+optional_security = HTTPBearer(auto_error=False)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
+# Cache del usuario autenticado por (id_usuario, iat del token). Se invalida
+# explícitamente al cambiar el perfil, la contraseña o borrar la cuenta (entre
+# workers, ver TTLCache en utils/cache.py).
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated user as seen by the routes (only what they need, no ORM session attached)"""
+    id_usuario: int
+    tipo_usuario: str
+    email: str
+
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_principal(id_usuario: int):
+    """Drop the cached principal of a user (all of their tokens)"""
+    _principal_cache.discard_where(lambda key: key[0] == id_usuario)
+
+# Versiones sincrónicas (scripts). Las rutas usan utils.hashing.password_hasher
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -35,14 +57,12 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Esta función ahora anda porque el alias de la línea 2
-# hace que "HTTPAuthCredentials" siga existiendo.
-def get_current_user(credentials: HTTPAuthCredentials = Depends(security), db: Session = Depends(get_db)):
-    token = credentials.credentials
+def decode_access_token(token: str) -> dict:
+    """Validate a JWT and return its payload"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -61,12 +81,29 @@ def get_current_user(credentials: HTTPAuthCredentials = Depends(security), db: S
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido"
         )
+    return payload
+
+# Esta función ahora anda porque el alias de la línea 2
+# hace que "HTTPAuthCredentials" siga existiendo.
+def get_current_user(credentials: HTTPAuthCredentials = Depends(security), db: Session = Depends(get_db)):
+    payload = decode_access_token(credentials.credentials)
+    user_id = int(payload["sub"])
+    cache_key = (user_id, payload.get("iat"))
+    
+    # Camino común: sin query (ni conexión del pool) si ya lo vimos hace poco
+    principal = _principal_cache.get(cache_key)
+    if principal is not None:
+        return principal
     
-    user = db.query(Usuario).filter(Usuario.id_usuario == int(user_id)).first()
+    user = db.query(Usuario.id_usuario, Usuario.tipo_usuario, Usuario.email).filter(
+        Usuario.id_usuario == user_id
+    ).first()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario no encontrado"
         )
     
-    return user
+    principal = Principal(id_usuario=user.id_usuario, tipo_usuario=user.tipo_usuario, email=user.email)
+    _principal_cache.set(cache_key, principal)
+    return principal
\ No newline at end of file
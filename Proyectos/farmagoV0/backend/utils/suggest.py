@@ -0,0 +1,132 @@
+import bisect
+import os
+import threading
+from database import SessionLocal
+from models import Cambio, Medicamento
+from utils.search import normalize_text
+from utils.changes import safe_upper_bound
+
+# Autocompletado sin ir a la base: una lista ordenada de (clave, id) en memoria
+# y bisect para encontrar el primer elemento con el prefijo. Cada medicamento
+# aporta una clave por cada palabra de su nombre y de su principio activo
+# ("ibuprofeno 400mg" -> "ibuprofeno 400mg", "400mg").
+#
+# create_medication actualiza el índice de su proceso; los demás workers se
+# enteran leyendo el diario de cambios cada SUGGEST_REFRESH_SECONDS.
+SUGGEST_REFRESH_SECONDS = float(os.getenv("SUGGEST_REFRESH_SECONDS", "30"))
+
+def _keys(nombre_comercial: str, principio_activo: str):
+    keys = set()
+    for value in (nombre_comercial, principio_activo):
+        words = normalize_text(value or "").split()
+        keys.update(" ".join(words[i:]) for i in range(len(words)))
+    return keys
+
+class SuggestIndex:
+    """In-memory prefix index over medication names and active ingredients"""
+
+    def __init__(self):
+        # Copy-on-write: (entradas, etiquetas) se reemplazan juntas con una sola
+        # asignación y las lecturas toman la tupla vigente sin el lock
+        self._state = ([], {})
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def build(self, db):
+        """Load every medication (called at startup)"""
+        last_seq = safe_upper_bound(db)
+        rows = db.query(Medicamento.id_medicamento, Medicamento.nombre_comercial, Medicamento.principio_activo).all()
+        entries = sorted((key, id) for id, nombre, principio in rows for key in _keys(nombre, principio))
+        with self._lock:
+            self._state = (entries, {id: (nombre, principio) for id, nombre, principio in rows})
+            self._last_seq = last_seq
+
+    def add(self, id_medicamento: int, nombre_comercial: str, principio_activo: str):
+        """Insert or replace one medication"""
+        with self._lock:
+            entries, labels = self._state
+            entries = [e for e in entries if e[1] != id_medicamento] if id_medicamento in labels else list(entries)
+            for key in _keys(nombre_comercial, principio_activo):
+                bisect.insort(entries, (key, id_medicamento))
+            labels = dict(labels)
+            labels[id_medicamento] = (nombre_comercial, principio_activo)
+            self._state = (entries, labels)
+
+    def remove(self, id_medicamento: int):
+        with self._lock:
+            entries, labels = self._state
+            if id_medicamento not in labels:
+                return
+            labels = dict(labels)
+            del labels[id_medicamento]
+            self._state = ([e for e in entries if e[1] != id_medicamento], labels)
+
+    def suggest(self, prefix: str, limit: int = 10):
+        """Medications whose name or active ingredient has a word starting with prefix"""
+        prefix = normalize_text(prefix).strip()
+        if not prefix:
+            return []
+        entries, labels = self._state
+        results, seen = [], set()
+        for i in range(bisect.bisect_left(entries, (prefix,)), len(entries)):
+            key, id_medicamento = entries[i]
+            if not key.startswith(prefix):
+                break
+            if id_medicamento in seen:
+                continue
+            seen.add(id_medicamento)
+            nombre, principio = labels[id_medicamento]
+            results.append({"id_medicamento": id_medicamento, "nombre_comercial": nombre, "principio_activo": principio})
+            if len(results) == limit:
+                break
+        return results
+
+    def refresh(self, db):
+        """Apply medication changes written by other workers (change journal)"""
+        bound = safe_upper_bound(db)
+        changes = (
+            db.query(Cambio.seq, Cambio.id_registro, Medicamento.nombre_comercial, Medicamento.principio_activo)
+            .outerjoin(Medicamento, Medicamento.id_medicamento == Cambio.id_registro)
+            .filter(Cambio.tabla == "medicamento", Cambio.seq > self._last_seq, Cambio.seq <= bound)
+            .order_by(Cambio.seq)
+            .all()
+        )
+        for seq, id_medicamento, nombre, principio in changes:
+            if nombre is None:
+                self.remove(id_medicamento)
+            else:
+                self.add(id_medicamento, nombre, principio)
+            self._last_seq = seq
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            self.build(db)
+        finally:
+            db.close()
+        if SUGGEST_REFRESH_SECONDS > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="suggest-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _refresh_loop(self):
+        while not self._stopping.wait(SUGGEST_REFRESH_SECONDS):
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception as e:
+                print(f"No se pudo actualizar el índice de sugerencias: {e}")
+            finally:
+                db.close()
+
+    def __len__(self):
+        return len(self._state[1])
+
+suggest_index = SuggestIndex()